@@ -0,0 +1,277 @@
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT, METRICS_ENABLED
+
+def retry_after_headers(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(math.ceil(seconds), 1))}
+
+class Rejected(Exception):
+    """A request turned away by admission control; retry after ``retry_after`` seconds"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float, reason: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return retry_after_headers(self.retry_after)
+
+class TokenBucket:
+    """Refills at ``per_minute / 60`` units a second up to a burst of ``per_minute``.
+
+    The level may go negative when a request turns out to cost more than was
+    reserved; later requests then wait for the debt to refill.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        # ``now`` may predate a bucket created after it was read
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` can be taken (capped at the burst size)"""
+        self._refill(now)
+        shortfall = min(amount, self.capacity) - self.level
+        return shortfall / self.rate if shortfall > 0 else 0.0
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def give(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+class Ticket:
+    """An admitted request: holds a concurrency slot and its token reservations"""
+
+    def __init__(self, controller: "AdmissionController", buckets: List[TokenBucket], tokens: int):
+        self.controller = controller
+        self.buckets = buckets
+        self.tokens = tokens
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self, used_tokens: Optional[int] = None):
+        """Free the slot and settle the token reservation; safe to call twice"""
+        if self.released:
+            return
+        self.released = True
+        self.controller._release(self, used_tokens)
+
+class AdmissionController:
+    """Admission control in front of the model.
+
+    A request is admitted in two steps:
+
+    1. Per-client and per-chat token buckets, each limiting requests and
+       model tokens per minute. A request that does not fit is rejected at
+       once with the time until it would. Token costs are reserved up front
+       from an estimate and settled against the reported usage on release.
+    2. A global limit of ``max_concurrency`` model calls in flight. Up to
+       ``max_queue`` requests wait for a slot, each for at most
+       ``queue_timeout`` seconds; beyond that they are rejected at once.
+
+    After the provider itself answers 429, every request is rejected until
+    its Retry-After has passed instead of piling more calls onto it.
+    Limits are per process.
+    """
+
+    def __init__(self, max_concurrency: int = 32, max_queue: int = 64, queue_timeout: float = 10.0,
+                 client_requests_per_minute: float = 0, client_tokens_per_minute: float = 0,
+                 chat_requests_per_minute: float = 0, chat_tokens_per_minute: float = 0,
+                 max_keys: int = 10000):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.limits = {
+            "client": (client_requests_per_minute, client_tokens_per_minute),
+            "chat": (chat_requests_per_minute, chat_tokens_per_minute),
+        }
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # (scope, key) -> (request bucket, token bucket)
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+        self._avg_hold = 1.0  # moving average of seconds a slot is held
+        self._cooldown_until = 0.0
+        self._stats = {"admitted": 0, "rejected": 0, "timed_out": 0, "provider_rate_limited": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        """Build the controller from ADMISSION_* settings; None when disabled"""
+        if os.environ.get("ADMISSION_ENABLED", "1") != "1":
+            return None
+        return cls(
+            max_concurrency=int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "32")),
+            max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", "64")),
+            queue_timeout=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "10")),
+            client_requests_per_minute=float(os.environ.get("ADMISSION_CLIENT_REQUESTS_PER_MINUTE", "0")),
+            client_tokens_per_minute=float(os.environ.get("ADMISSION_CLIENT_TOKENS_PER_MINUTE", "0")),
+            chat_requests_per_minute=float(os.environ.get("ADMISSION_CHAT_REQUESTS_PER_MINUTE", "0")),
+            chat_tokens_per_minute=float(os.environ.get("ADMISSION_CHAT_TOKENS_PER_MINUTE", "0")),
+        )
+
+    def _reject(self, status_code: int, detail: str, retry_after: float, reason: str) -> Rejected:
+        self._stats["timed_out" if reason == "queue_timeout" else "rejected"] += 1
+        if METRICS_ENABLED:
+            ADMISSION_REJECTIONS.inc(reason=reason)
+        return Rejected(status_code, detail, retry_after, reason)
+
+    def _get_buckets(self, scope: str, key) -> Optional[tuple]:
+        requests_per_minute, tokens_per_minute = self.limits[scope]
+        if not requests_per_minute and not tokens_per_minute:
+            return None
+        buckets = self._buckets.get((scope, key))
+        if buckets is None:
+            buckets = (TokenBucket(requests_per_minute) if requests_per_minute else None,
+                       TokenBucket(tokens_per_minute) if tokens_per_minute else None)
+            self._buckets[(scope, key)] = buckets
+            # Past max_keys the least recently seen keys are forgotten and
+            # start over with full buckets
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end((scope, key))
+        return buckets
+
+    def _charge(self, client: str, chat_id: int, tokens: int) -> List[TokenBucket]:
+        """Take one request and ``tokens`` from every applicable bucket, or raise Rejected"""
+        now = time.monotonic()
+        charges = []  # (bucket, amount, scope, unit)
+        for scope, key in (("client", client), ("chat", chat_id)):
+            buckets = self._get_buckets(scope, key)
+            if buckets is None:
+                continue
+            request_bucket, token_bucket = buckets
+            if request_bucket is not None:
+                charges.append((request_bucket, 1, scope, "requests"))
+            if token_bucket is not None:
+                charges.append((token_bucket, tokens, scope, "tokens"))
+        for bucket, amount, scope, unit in charges:
+            wait = bucket.wait_time(amount, now)
+            if wait > 0:
+                raise self._reject(429, f"Rate limit exceeded: too many {unit} for this {scope}",
+                                   wait, f"{scope}_{unit}")
+        for bucket, amount, _, _ in charges:
+            bucket.take(amount)
+        # Only token buckets are settled against actual usage on release
+        return [bucket for bucket, _, _, unit in charges if unit == "tokens"]
+
+    def _retry_hint(self) -> float:
+        """Rough time until a queued request would get a slot"""
+        return self._avg_hold * (self._waiting / self.max_concurrency + 1)
+
+    async def admit(self, client: str, chat_id: int, tokens: int) -> Ticket:
+        """Admit one model call of about ``tokens`` tokens, waiting in the queue if needed.
+
+        Raises Rejected (429 for rate limits and a full queue, 503 when the
+        queue wait times out).
+        """
+        cooldown = self._cooldown_until - time.monotonic()
+        if cooldown > 0:
+            raise self._reject(429, "Model provider is rate limiting; try again later",
+                               cooldown, "provider_cooldown")
+        token_buckets = self._charge(client, chat_id, tokens)
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            for bucket in token_buckets:
+                bucket.give(tokens)
+            raise
+        self._in_flight += 1
+        self._stats["admitted"] += 1
+        return Ticket(self, token_buckets, tokens)
+
+    async def admit_background(self) -> Ticket:
+        """Admit a background model call only if it would not hold up a user request.
+
+        Raises Rejected during a provider cooldown, or with 503 while
+        requests are queued or every slot is taken. Rate limits do not apply.
+        """
+        cooldown = self._cooldown_until - time.monotonic()
+        if cooldown > 0:
+            raise self._reject(429, "Model provider is rate limiting; try again later",
+                               cooldown, "provider_cooldown")
+        if self._waiting or self._slots.locked():
+            raise self._reject(503, "Server is busy; background work deferred", self._retry_hint(),
+                               "background_deferred")
+        await self._slots.acquire()
+        self._in_flight += 1
+        self._stats["admitted"] += 1
+        return Ticket(self, [], 0)
+
+    async def _acquire_slot(self):
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return
+        if self._waiting >= self.max_queue:
+            raise self._reject(429, "Server is at capacity; try again later", self._retry_hint(), "queue_full")
+        self._waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(503, "Timed out waiting for capacity; try again later",
+                               self._retry_hint(), "queue_timeout")
+        finally:
+            self._waiting -= 1
+            if METRICS_ENABLED:
+                ADMISSION_WAIT.observe(time.monotonic() - started)
+
+    def _release(self, ticket: Ticket, used_tokens: Optional[int]):
+        self._in_flight -= 1
+        self._slots.release()
+        held = time.monotonic() - ticket.started
+        self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+        if used_tokens is not None:
+            for bucket in ticket.buckets:
+                if used_tokens > ticket.tokens:
+                    bucket.take(used_tokens - ticket.tokens)
+                else:
+                    bucket.give(ticket.tokens - used_tokens)
+
+    def provider_rate_limited(self, retry_after: float):
+        """Hold off new model calls after the provider answered 429"""
+        self._stats["provider_rate_limited"] += 1
+        self._cooldown_until = max(self._cooldown_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict:
+        return {
+            **self._stats,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "tracked_keys": len(self._buckets),
+            "cooldown_seconds": round(max(self._cooldown_until - time.monotonic(), 0.0), 3),
+        }
+
+def provider_retry_after(error: Exception, default: float = 1.0) -> Optional[float]:
+    """Seconds to back off if ``error`` is a 429 from the model provider, else None.
+
+    Checks the status code rather than the openai exception class so the
+    openai package need not be imported to classify errors.
+    """
+    if getattr(error, "status_code", None) != 429:
+        return None
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[name]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return default
@@ -0,0 +1,540 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from migrations import migrate, get_connection_string, pending_versions
+from metrics import DB_CONNECT_DURATION, METRICS_ENABLED, timed_queries
+from storage import split_summary
+
+class TimedPool:
+    """Wrap an asyncpg pool so every checkout is recorded in DB_CONNECT_DURATION.
+
+    asyncpg's own ``fetch``/``execute`` helpers acquire internally, where
+    the wait cannot be timed, so they are re-implemented on ``acquire``.
+    """
+
+    def __init__(self, pool: "asyncpg.Pool"):
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        async with self._pool.acquire() as conn:
+            if METRICS_ENABLED:
+                DB_CONNECT_DURATION.observe(time.perf_counter() - started)
+            yield conn
+
+    async def execute(self, query: str, *args):
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args)
+
+    async def executemany(self, query: str, args):
+        async with self.acquire() as conn:
+            return await conn.executemany(query, args)
+
+    async def fetch(self, query: str, *args):
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args)
+
+    async def fetchval(self, query: str, *args):
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args)
+
+@timed_queries
+class AsyncDatabaseManager:
+    """asyncio counterpart of DatabaseManager built on an asyncpg pool.
+
+    The pool is created on first use, inside the running event loop, so the
+    manager can be constructed at import time; asyncpg itself is only
+    imported then.
+    """
+
+    def __init__(self, min_size: int = None, max_size: int = None):
+        self.connection_string = os.environ.get("DATABASE_URL")
+        self.min_size = min_size if min_size is not None else int(os.environ.get("DB_POOL_MIN_SIZE", "1"))
+        self.max_size = max_size if max_size is not None else int(os.environ.get("DB_POOL_MAX_SIZE", "10"))
+        self.max_idle = float(os.environ.get("DB_POOL_MAX_IDLE", "300"))
+        self.timeout = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def get_pool(self) -> TimedPool:
+        """Get the connection pool, creating it and the schema on first call"""
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    import asyncpg
+                    pool = TimedPool(await asyncpg.create_pool(
+                        self.connection_string,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        max_inactive_connection_lifetime=self.max_idle,
+                        timeout=self.timeout,
+                    ))
+                    await self.init_database(pool)
+                    self._pool = pool
+        return self._pool
+
+    async def init_database(self, pool: TimedPool):
+        """Check the schema is migrated; DDL lives in migrations.py"""
+        if os.environ.get("DB_AUTO_MIGRATE") == "1":
+            await asyncio.to_thread(migrate, get_connection_string())
+        async with pool.acquire() as conn:
+            applied = set()
+            if await conn.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL"):
+                applied = {row["version"] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+        pending = pending_versions(applied)
+        if pending:
+            print(f"Database schema is behind: migrations {pending} pending. Run: python migrations.py")
+
+    async def close(self):
+        """Close the connection pool"""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def ping(self):
+        """Run a trivial query; raises if the database is unreachable"""
+        pool = await self.get_pool()
+        await pool.fetchval("SELECT 1")
+
+    def pool_stats(self) -> Dict:
+        """Get connection pool statistics"""
+        if self._pool is None:
+            return {"min_size": self.min_size, "max_size": self.max_size, "size": 0, "idle": 0, "in_use": 0}
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {
+            "min_size": self._pool.get_min_size(),
+            "max_size": self._pool.get_max_size(),
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+        }
+
+    async def create_chat(self, title: str) -> int:
+        """Create a new chat session"""
+        pool = await self.get_pool()
+        return await pool.fetchval("""
+            INSERT INTO chats (title)
+            VALUES ($1)
+            RETURNING id
+        """, title)
+
+    async def get_all_chats(self) -> List[Dict]:
+        """Get all chat sessions"""
+        pool = await self.get_pool()
+        rows = await pool.fetch("""
+            SELECT id, title, created_at, updated_at, message_count, last_message_at
+            FROM chats
+            ORDER BY updated_at DESC, id DESC
+        """)
+        return [dict(row) for row in rows]
+
+    async def get_chats_page(self, limit: int, before: Tuple[datetime, int] = None,
+                             after: Tuple[datetime, int] = None) -> Tuple[List[Dict], bool]:
+        """Get one page of chats ordered by (updated_at, id) descending.
+
+        ``after``/``before`` are the (updated_at, id) keys of the row the
+        previous page ended/started at. Returns the rows and whether more
+        rows exist in the direction of travel.
+        """
+        pool = await self.get_pool()
+        if before is not None:
+            rows = await pool.fetch("""
+                SELECT id, title, created_at, updated_at, message_count, last_message_at
+                FROM chats
+                WHERE (updated_at, id) > ($1, $2)
+                ORDER BY updated_at ASC, id ASC
+                LIMIT $3
+            """, before[0], before[1], limit + 1)
+            page = [dict(row) for row in rows[:limit]]
+            page.reverse()
+        elif after is not None:
+            rows = await pool.fetch("""
+                SELECT id, title, created_at, updated_at, message_count, last_message_at
+                FROM chats
+                WHERE (updated_at, id) < ($1, $2)
+                ORDER BY updated_at DESC, id DESC
+                LIMIT $3
+            """, after[0], after[1], limit + 1)
+            page = [dict(row) for row in rows[:limit]]
+        else:
+            rows = await pool.fetch("""
+                SELECT id, title, created_at, updated_at, message_count, last_message_at
+                FROM chats
+                ORDER BY updated_at DESC, id DESC
+                LIMIT $1
+            """, limit + 1)
+            page = [dict(row) for row in rows[:limit]]
+        return page, len(rows) > limit
+
+    async def get_messages_page(self, chat_id: int, limit: int, before: int = None,
+                                after: int = None) -> Tuple[List[Dict], bool]:
+        """Get one page of a chat's messages in chronological order.
+
+        Without cursors this is the newest page. ``before``/``after`` are
+        message ids; returns the rows and whether more rows exist in the
+        direction of travel (older for ``before``, newer for ``after``).
+        """
+        pool = await self.get_pool()
+        if after is not None:
+            rows = await pool.fetch("""
+                SELECT id, role, content, personality, color, created_at
+                FROM messages
+                WHERE chat_id = $1 AND id > $2
+                ORDER BY id ASC
+                LIMIT $3
+            """, chat_id, after, limit + 1)
+            page = [dict(row) for row in rows[:limit]]
+        else:
+            if before is not None:
+                rows = await pool.fetch("""
+                    SELECT id, role, content, personality, color, created_at
+                    FROM messages
+                    WHERE chat_id = $1 AND id < $2
+                    ORDER BY id DESC
+                    LIMIT $3
+                """, chat_id, before, limit + 1)
+            else:
+                rows = await pool.fetch("""
+                    SELECT id, role, content, personality, color, created_at
+                    FROM messages
+                    WHERE chat_id = $1
+                    ORDER BY id DESC
+                    LIMIT $2
+                """, chat_id, limit + 1)
+            page = [dict(row) for row in rows[:limit]]
+            page.reverse()
+        return page, len(rows) > limit
+
+    async def get_chat_messages(self, chat_id: int) -> List[Dict]:
+        """Get all messages for a specific chat"""
+        pool = await self.get_pool()
+        rows = await pool.fetch("""
+            SELECT role, content, personality, color, created_at
+            FROM messages
+            WHERE chat_id = $1
+            ORDER BY created_at ASC
+        """, chat_id)
+        return [dict(row) for row in rows]
+
+    async def get_recent_messages(self, chat_id: int, limit: int, before: int = None) -> List[Dict]:
+        """Get up to ``limit`` messages of a chat, newest first, older than message id ``before``"""
+        pool = await self.get_pool()
+        if before is not None:
+            rows = await pool.fetch("""
+                SELECT id, role, content, token_count
+                FROM messages
+                WHERE chat_id = $1 AND id < $2
+                ORDER BY id DESC
+                LIMIT $3
+            """, chat_id, before, limit)
+        else:
+            rows = await pool.fetch("""
+                SELECT id, role, content, token_count
+                FROM messages
+                WHERE chat_id = $1
+                ORDER BY id DESC
+                LIMIT $2
+            """, chat_id, limit)
+        return [dict(row) for row in rows]
+
+    async def search_messages(self, query: str, limit: int, chat_id: int = None, role: str = None,
+                              personality: str = None, after: Tuple[float, int] = None) -> Tuple[List[Dict], bool]:
+        """Full-text search over messages, best matches first.
+
+        Matches come from the GIN index on ``search_vector``; only the rows
+        of the returned page get a highlighted snippet. ``after`` is the
+        (rank, id) of the last hit of the previous page.
+        """
+        pool = await self.get_pool()
+        # Only the filters actually given go into the SQL, so each
+        # combination gets its own prepared statement and plan
+        args = [query]
+        filters = ""
+        for column, value in (("chat_id", chat_id), ("role", role), ("personality", personality)):
+            if value is not None:
+                args.append(value)
+                filters += f" AND m.{column} = ${len(args)}"
+        cursor = ""
+        if after is not None:
+            args.extend(after)
+            cursor = f"WHERE (rank, id) < (${len(args) - 1}::real, ${len(args)}::integer)"
+        args.append(limit + 1)
+        rows = await pool.fetch(f"""
+            SELECT m.id, m.chat_id, c.title AS chat_title, m.role, m.personality, m.color,
+                   m.created_at, page.rank,
+                   ts_headline('english', m.content, page.query,
+                               'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2') AS snippet
+            FROM (
+                SELECT id, query, rank
+                FROM (
+                    SELECT m.id, q.query, ts_rank_cd(m.search_vector, q.query) AS rank
+                    FROM messages m, websearch_to_tsquery('english', $1) AS q(query)
+                    WHERE m.search_vector @@ q.query{filters}
+                ) hits
+                {cursor}
+                ORDER BY rank DESC, id DESC
+                LIMIT ${len(args)}
+            ) page
+            JOIN messages m ON m.id = page.id
+            JOIN chats c ON c.id = m.chat_id
+            ORDER BY page.rank DESC, page.id DESC
+        """, *args)
+        return [dict(row) for row in rows[:limit]], len(rows) > limit
+
+    async def get_chat_summary(self, chat_id: int) -> Optional[Dict]:
+        """Get a chat's stored summary and the last message id it covers"""
+        pool = await self.get_pool()
+        row = await pool.fetchrow("""
+            SELECT content, covered_message_id, token_count, updated_at
+            FROM chat_summaries
+            WHERE chat_id = $1
+        """, chat_id)
+        return dict(row) if row else None
+
+    async def save_chat_summary(self, chat_id: int, content: str, covered_message_id: int, token_count: int):
+        """Store a chat's summary unless a newer one is already stored.
+
+        Does nothing if the chat has been deleted meanwhile.
+        """
+        pool = await self.get_pool()
+        await pool.execute("""
+            INSERT INTO chat_summaries (chat_id, content, covered_message_id, token_count)
+            SELECT id, $2, $3, $4 FROM chats WHERE id = $1
+            ON CONFLICT (chat_id) DO UPDATE
+            SET content = EXCLUDED.content,
+                covered_message_id = EXCLUDED.covered_message_id,
+                token_count = EXCLUDED.token_count,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE chat_summaries.covered_message_id < EXCLUDED.covered_message_id
+        """, chat_id, content, covered_message_id, token_count)
+
+    async def set_token_counts(self, counts: List[tuple]):
+        """Store token counts given as (message_id, token_count) pairs"""
+        pool = await self.get_pool()
+        await pool.executemany("""
+            UPDATE messages SET token_count = $2 WHERE id = $1
+        """, counts)
+
+    async def add_message(self, chat_id: int, role: str, content: str,
+                          personality: str = None, color: str = None, token_count: int = None):
+        """Add a message to a chat"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO messages (chat_id, role, content, personality, color, token_count)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                """, chat_id, role, content, personality, color, token_count)
+
+                # Update chat's updated_at timestamp and counters
+                await conn.execute("""
+                    UPDATE chats
+                    SET updated_at = CURRENT_TIMESTAMP,
+                        message_count = message_count + 1,
+                        last_message_at = CURRENT_TIMESTAMP
+                    WHERE id = $1
+                """, chat_id)
+
+    async def add_messages_batch(self, messages: List[Dict]):
+        """Insert many messages with one statement and bump each chat once.
+
+        Messages whose chat no longer exists are skipped.
+        """
+        if not messages:
+            return
+        pool = await self.get_pool()
+        counts = {}
+        for message in messages:
+            counts[message["chat_id"]] = counts.get(message["chat_id"], 0) + 1
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO messages (chat_id, role, content, personality, color, token_count)
+                    SELECT v.chat_id, v.role, v.content, v.personality, v.color, v.token_count
+                    FROM unnest($1::integer[], $2::text[], $3::text[], $4::text[], $5::text[], $6::integer[])
+                         WITH ORDINALITY AS v(chat_id, role, content, personality, color, token_count, ord)
+                    JOIN chats c ON c.id = v.chat_id
+                    ORDER BY v.ord
+                """, [m["chat_id"] for m in messages], [m["role"] for m in messages],
+                    [m["content"] for m in messages], [m.get("personality") for m in messages],
+                    [m.get("color") for m in messages], [m.get("token_count") for m in messages])
+
+                # One counter update per chat, not per message
+                await conn.execute("""
+                    UPDATE chats c
+                    SET updated_at = CURRENT_TIMESTAMP,
+                        message_count = c.message_count + v.added,
+                        last_message_at = CURRENT_TIMESTAMP
+                    FROM unnest($1::integer[], $2::integer[]) AS v(chat_id, added)
+                    WHERE c.id = v.chat_id
+                """, list(counts.keys()), list(counts.values()))
+
+    async def export_rows(self, prefetch: int = 1000) -> AsyncIterator[Dict]:
+        """Yield every chat joined with its messages, ordered by chat then message id.
+
+        Reads through a server-side cursor inside one read-only snapshot.
+        """
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                async for row in conn.cursor("""
+            SELECT c.id AS chat_id, c.title, c.created_at AS chat_created_at, c.updated_at AS chat_updated_at,
+                   m.id AS message_id, m.role, m.content, m.personality, m.color, m.token_count, m.created_at
+            FROM chats c
+            LEFT JOIN messages m ON m.chat_id = c.id
+            ORDER BY c.id, m.id
+                """, prefetch=prefetch):
+                    yield dict(row)
+
+    async def import_chat(self, title: str, created_at: datetime = None, updated_at: datetime = None) -> int:
+        """Create a chat from an export, keeping its timestamps"""
+        pool = await self.get_pool()
+        return await pool.fetchval("""
+            INSERT INTO chats (title, created_at, updated_at)
+            VALUES ($1, COALESCE($2, CURRENT_TIMESTAMP), COALESCE($3, CURRENT_TIMESTAMP))
+            RETURNING id
+        """, title, created_at, updated_at)
+
+    async def import_messages(self, messages: List[Dict]):
+        """Bulk-load exported messages with COPY and update their chats' counters"""
+        if not messages:
+            return
+        columns = ["chat_id", "role", "content", "personality", "color", "token_count", "created_at"]
+        counters = {}
+        for message in messages:
+            count, last = counters.get(message["chat_id"], (0, message["created_at"]))
+            counters[message["chat_id"]] = (count + 1, max(last, message["created_at"]))
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.copy_records_to_table(
+                    "messages",
+                    records=[tuple(message[column] for column in columns) for message in messages],
+                    columns=columns,
+                )
+                await conn.execute("""
+                    UPDATE chats c
+                    SET message_count = c.message_count + v.added,
+                        last_message_at = GREATEST(c.last_message_at, v.last_message_at)
+                    FROM unnest($1::integer[], $2::integer[], $3::timestamp[]) AS v(chat_id, added, last_message_at)
+                    WHERE c.id = v.chat_id
+                """, list(counters.keys()), [c[0] for c in counters.values()], [c[1] for c in counters.values()])
+
+    async def begin_turn(self, chat_id: int, content: str, token_count: int = None,
+                         context_limit: int = 50) -> Optional[Dict]:
+        """Store a user message and read back recent context in one statement.
+
+        Bumps the chat's timestamp and counters, inserts the message and
+        returns ``{"message": <new row>, "recent": <up to context_limit rows,
+        newest first, including the new one>, "summary": <the chat's stored
+        summary or None>}``, or None if the chat does not exist.
+        """
+        pool = await self.get_pool()
+        rows = await pool.fetch("""
+            WITH chat AS (
+                UPDATE chats
+                SET updated_at = CURRENT_TIMESTAMP,
+                    message_count = message_count + 1,
+                    last_message_at = CURRENT_TIMESTAMP
+                WHERE id = $1
+                RETURNING id
+            ), inserted AS (
+                INSERT INTO messages (chat_id, role, content, token_count)
+                SELECT id, 'user', $2, $3 FROM chat
+                RETURNING id, chat_id, role, content, token_count, created_at
+            )
+            -- The chat's summary rides along on the new row only
+            SELECT i.id, i.role, i.content, i.token_count, i.created_at,
+                   s.content AS summary_content, s.covered_message_id AS summary_covered_message_id,
+                   s.token_count AS summary_token_count
+            FROM inserted i
+            LEFT JOIN chat_summaries s ON s.chat_id = i.chat_id
+            UNION ALL
+            (
+                -- Sees the snapshot from before the insert, so never the new row
+                SELECT id, role, content, token_count, created_at, NULL, NULL, NULL
+                FROM messages
+                WHERE chat_id = $1 AND EXISTS (SELECT 1 FROM chat)
+                ORDER BY id DESC
+                LIMIT $4
+            )
+        """, chat_id, content, token_count, context_limit - 1)
+        if not rows:
+            return None
+        recent = sorted((dict(row) for row in rows), key=lambda row: row["id"], reverse=True)
+        return {"message": recent[0], "recent": recent, "summary": split_summary(recent)}
+
+    async def finish_turn(self, chat_id: int, content: str, personality: str = None,
+                          color: str = None, token_count: int = None) -> Dict:
+        """Store an assistant reply and bump the chat's counters in one statement"""
+        pool = await self.get_pool()
+        row = await pool.fetchrow("""
+            WITH inserted AS (
+                INSERT INTO messages (chat_id, role, content, personality, color, token_count)
+                VALUES ($1, 'assistant', $2, $3, $4, $5)
+                RETURNING id, created_at
+            ), chat AS (
+                UPDATE chats
+                SET updated_at = CURRENT_TIMESTAMP,
+                    message_count = message_count + 1,
+                    last_message_at = CURRENT_TIMESTAMP
+                WHERE id = $1
+            )
+            SELECT id, created_at FROM inserted
+        """, chat_id, content, personality, color, token_count)
+        return dict(row)
+
+    async def delete_message(self, message_id: int):
+        """Delete a single message and update its chat's counters"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                chat_id = await conn.fetchval("""
+                    DELETE FROM messages WHERE id = $1 RETURNING chat_id
+                """, message_id)
+                if chat_id is None:
+                    return
+                await conn.execute("""
+                    UPDATE chats
+                    SET message_count = GREATEST(message_count - 1, 0),
+                        last_message_at = (
+                            SELECT MAX(created_at) FROM messages WHERE chat_id = $1
+                        )
+                    WHERE id = $1
+                """, chat_id)
+
+    async def delete_chat(self, chat_id: int):
+        """Delete a chat and all its messages"""
+        pool = await self.get_pool()
+        await pool.execute("DELETE FROM chats WHERE id = $1", chat_id)
+
+    async def update_chat_title(self, chat_id: int, title: str):
+        """Update chat title"""
+        pool = await self.get_pool()
+        await pool.execute("""
+            UPDATE chats
+            SET title = $1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = $2
+        """, title, chat_id)
+
+    async def get_chat_info(self, chat_id: int) -> Optional[Dict]:
+        """Get chat information"""
+        pool = await self.get_pool()
+        row = await pool.fetchrow("""
+            SELECT id, title, created_at, updated_at
+            FROM chats
+            WHERE id = $1
+        """, chat_id)
+        return dict(row) if row else None
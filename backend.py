@@ -1,18 +1,116 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
 import os
 import json
-from openai import OpenAI
-from database import DatabaseManager
+import time
+import signal
+import asyncio
+from datetime import datetime
+from storage import create_async_database_manager
+from context_builder import ContextBuilder, count_tokens
+from response_cache import ResponseCache
+from write_behind import WriteBehindQueue
+from summarizer import ConversationSummarizer
+from admission import AdmissionController, Rejected, provider_retry_after, retry_after_headers
+from metrics import MetricsMiddleware, render_metrics, span, observe_stage, observe_tokens
+from profiler import Profiler, ProfilerMiddleware
+from transfer import export_ndjson, import_ndjson
+from pagination import (encode_chat_cursor, decode_chat_cursor, encode_message_cursor, decode_message_cursor,
+                        encode_search_cursor, decode_search_cursor)
 
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "your-api-key-here")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+OPENAI_MODEL = "gpt-4o"
+MAX_COMPLETION_TOKENS = 500
+TEMPERATURE = 0.8
 
-app = FastAPI(title="SkyNetAI Backend", version="1.0.0")
+# Importing openai costs more than the rest of the app together, so the
+# client is built on the first model call rather than on every cold start
+_openai_client = None
+
+def get_openai_client():
+    """The shared AsyncOpenAI client, created on first use"""
+    global _openai_client
+    if _openai_client is None:
+        from openai import AsyncOpenAI
+        _openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+
+# Initialize database: PostgreSQL when DATABASE_URL is set, embedded SQLite
+# otherwise. Nothing connects here: the pool (or SQLite file) is opened and
+# the schema checked on the first query
+db = create_async_database_manager()
+
+# Bounds concurrent model calls and per-client/per-chat request and token
+# rates, so bursts get fast 429s instead of slow failures (ADMISSION_ENABLED=0 to turn off)
+admission = AdmissionController.from_env()
+
+# Optional per-chat summary of older history, at the cost of extra model calls (SUMMARY_ENABLED=1);
+# refreshes only run when admission control has a spare slot
+summarizer = ConversationSummarizer.from_env(db, get_openai_client, OPENAI_MODEL,
+                                             lambda text: count_tokens(text, OPENAI_MODEL),
+                                             admission=admission)
+
+# Prompt history is trimmed to the model's token budget
+context_builder = ContextBuilder(db, OPENAI_MODEL, max_completion_tokens=MAX_COMPLETION_TOKENS,
+                                 summarizer=summarizer)
+
+# Optional exact-match completion cache (RESPONSE_CACHE_ENABLED=1)
+response_cache = ResponseCache.from_env()
+
+# Optional batched, off-request-path storage of replies (WRITE_BEHIND_ENABLED=1)
+write_behind = WriteBehindQueue.from_env(db)
+
+# Readiness: /ready turns 503 as soon as SIGTERM arrives, so a load balancer
+# stops routing here while uvicorn finishes the in-flight requests
+READY_TIMEOUT = float(os.environ.get("READY_TIMEOUT", "2"))
+draining = False
+
+def watch_for_shutdown():
+    """Chain a handler in front of uvicorn's SIGTERM/SIGINT handlers"""
+    def handler(previous):
+        def on_signal(signum, frame):
+            global draining
+            draining = True
+            if callable(previous):
+                previous(signum, frame)
+        return on_signal
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            signal.signal(sig, handler(signal.getsignal(sig)))
+        except ValueError:
+            # Not the main thread (e.g. a test client); readiness then only
+            # reflects the database
+            pass
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watch_for_shutdown()
+    if write_behind is not None:
+        write_behind.start()
+    yield
+    if write_behind is not None:
+        await write_behind.stop()
+    if summarizer is not None:
+        await summarizer.stop()
+    await db.close()
+    if _openai_client is not None:
+        await _openai_client.close()
+
+app = FastAPI(title="SkyNetAI Backend", version="1.0.0", lifespan=lifespan)
+
+# Per-route request duration histograms, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Opt-in request profiling (off unless PROFILER_ADMIN_TOKEN is set)
+profiler = Profiler.from_env()
+app.add_middleware(ProfilerMiddleware, profiler=profiler)
 
 # Add CORS middleware
 app.add_middleware(
@@ -23,9 +121,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize database
-db = DatabaseManager()
-
 # Skynet Neural Agent Personalities
 PERSONALITIES = {
     "tactical": {
@@ -59,12 +154,18 @@ class ChatRequest(BaseModel):
     message: str
     domain: str
     chat_id: int
+    fresh: bool = False
 
 class ChatResponse(BaseModel):
     response: str
     personality: str
     chat_id: int
     color: str
+    user_message_id: int
+    user_created_at: datetime
+    # None when the reply is still queued for write-behind storage
+    message_id: Optional[int] = None
+    created_at: Optional[datetime] = None
 
 class CreateChatRequest(BaseModel):
     title: str
@@ -77,6 +178,17 @@ class CreateChatResponse(BaseModel):
 async def root():
     return {"message": "Skynet Neural Network Online", "status": "All systems operational"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 while shutting down or when the database is unreachable"""
+    if draining:
+        raise HTTPException(status_code=503, detail="Draining")
+    try:
+        await asyncio.wait_for(db.ping(), READY_TIMEOUT)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e) or type(e).__name__}")
+    return {"status": "ready"}
+
 @app.get("/personalities")
 async def get_personalities():
     """Get available AI personalities"""
@@ -88,108 +200,472 @@ async def get_personalities():
         for domain, info in PERSONALITIES.items()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics for this worker"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def require_profiler_token(token: Optional[str]):
+    """Reject profile requests without the admin token"""
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+    if not profiler.is_authorized(token):
+        raise HTTPException(status_code=403, detail="Invalid profiler token")
+
+@app.get("/debug/profiles")
+async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    """List the most recent request profiles, newest first"""
+    require_profiler_token(x_profile_token)
+    return {"profiles": [profile.summary() for profile in reversed(profiler.profiles)]}
+
+@app.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, kind: str = Query("wall", pattern="^(wall|cpu)$"),
+                      x_profile_token: Optional[str] = Header(None)):
+    """Get one profile as collapsed stacks, ready for flamegraph.pl or speedscope"""
+    require_profiler_token(x_profile_token)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile.collapsed(kind))
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get response cache hit/miss counters"""
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+@app.get("/admission/stats")
+async def get_admission_stats():
+    """Get admission control queue and rejection counters"""
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, **admission.stats()}
+
 @app.post("/chats", response_model=CreateChatResponse)
 async def create_chat(request: CreateChatRequest):
     """Create a new chat session"""
     try:
-        chat_id = db.create_chat(request.title)
+        chat_id = await db.create_chat(request.title)
         return CreateChatResponse(id=chat_id, title=request.title)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating chat: {str(e)}")
 
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def decode_page_cursors(decode, before: Optional[str], after: Optional[str]):
+    """Decode before/after query cursors, rejecting bad or conflicting ones"""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Pass either 'before' or 'after', not both")
+    try:
+        return (decode(before) if before else None), (decode(after) if after else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/chats")
-async def get_chats():
-    """Get all chat sessions"""
+async def get_chats(limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                    before: Optional[str] = None, after: Optional[str] = None):
+    """Get a page of chat sessions, most recently updated first.
+
+    Pass the returned ``after`` cursor to get the next (older) page and
+    ``before`` to get the previous one.
+    """
+    before_key, after_key = decode_page_cursors(decode_chat_cursor, before, after)
     try:
-        return {"chats": db.get_all_chats()}
+        chats, has_more = await db.get_chats_page(limit, before=before_key, after=after_key)
+        return {
+            "chats": chats,
+            "has_more": has_more,
+            "before": encode_chat_cursor(chats[0]["updated_at"], chats[0]["id"]) if chats else None,
+            "after": encode_chat_cursor(chats[-1]["updated_at"], chats[-1]["id"]) if chats else None
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching chats: {str(e)}")
 
 @app.get("/chats/{chat_id}")
-async def get_chat(chat_id: int):
-    """Get chat information and messages"""
+async def get_chat(chat_id: int, limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                   before: Optional[str] = None, after: Optional[str] = None,
+                   since: Optional[int] = Query(None, ge=0)):
+    """Get chat information and a page of its messages in chronological order.
+
+    Without cursors the newest page is returned. Pass the returned ``before``
+    cursor to load older messages and ``after`` to load newer ones.
+    ``since`` is a message id: only messages newer than it are returned.
+    """
+    if since is not None and (before or after):
+        raise HTTPException(status_code=400, detail="Pass either 'since' or a cursor, not both")
+    before_id, after_id = decode_page_cursors(decode_message_cursor, before, after)
+    if since is not None:
+        after_id = since
     try:
-        chat_info = db.get_chat_info(chat_id)
+        chat_info = await db.get_chat_info(chat_id)
         if not chat_info:
             raise HTTPException(status_code=404, detail="Chat not found")
         
-        messages = db.get_chat_messages(chat_id)
+        messages, has_more = await db.get_messages_page(chat_id, limit, before=before_id, after=after_id)
         return {
             "chat": chat_info,
-            "messages": messages
+            "messages": messages,
+            "has_more": has_more,
+            "before": encode_message_cursor(messages[0]["id"]) if messages else None,
+            "after": encode_message_cursor(messages[-1]["id"]) if messages else None
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching chat: {str(e)}")
 
+SEARCH_PAGE_SIZE = 20
+
+@app.get("/search")
+async def search_messages(q: str = Query(..., min_length=1, max_length=500),
+                          chat_id: Optional[int] = None,
+                          role: Optional[str] = Query(None, pattern="^(user|assistant)$"),
+                          personality: Optional[str] = None,
+                          limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          after: Optional[str] = None):
+    """Search message history, best matches first.
+
+    ``personality`` is a domain key from /personalities. Pass the returned
+    ``after`` cursor to get the next page.
+    """
+    if personality is not None and personality not in PERSONALITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid personality. Available: {list(PERSONALITIES.keys())}")
+    _, after_key = decode_page_cursors(decode_search_cursor, None, after)
+    try:
+        results, has_more = await db.search_messages(
+            q, limit, chat_id=chat_id, role=role,
+            personality=PERSONALITIES[personality]["name"] if personality else None,
+            after=after_key
+        )
+        return {
+            "results": results,
+            "has_more": has_more,
+            "after": encode_search_cursor(results[-1]["rank"], results[-1]["id"]) if has_more else None
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching messages: {str(e)}")
+
 @app.delete("/chats/{chat_id}")
 async def delete_chat(chat_id: int):
     """Delete a chat session"""
     try:
-        db.delete_chat(chat_id)
+        await db.delete_chat(chat_id)
         return {"message": "Chat deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting chat: {str(e)}")
 
+@app.get("/export")
+async def export_chats(format: str = Query("ndjson", pattern="^(ndjson|gzip)$")):
+    """Stream all chats and messages as NDJSON, optionally gzip-compressed"""
+    compress = format == "gzip"
+    filename = f"skynet_ai_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+    if compress:
+        filename += ".gz"
+    return StreamingResponse(
+        export_ndjson(db, compress=compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/import")
+async def import_chats(request: Request, format: Optional[str] = Query(None, pattern="^(ndjson|gzip)$")):
+    """Import chats from an NDJSON export, streamed from the request body"""
+    compressed = (
+        format == "gzip"
+        or request.headers.get("content-encoding", "").lower() == "gzip"
+        or request.headers.get("content-type", "").startswith("application/gzip")
+    )
+    try:
+        return await import_ndjson(db, request.stream(), compressed=compressed)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing chats: {str(e)}")
+
+async def check_chat_turn(request: ChatRequest, endpoint: str) -> Dict:
+    """Reject a bad domain or unknown chat before admission; returns the personality.
+
+    Runs first so requests bound for a 400 or 404 take no admission slot
+    or rate limit credit.
+    """
+    if request.domain not in PERSONALITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid domain. Available: {list(PERSONALITIES.keys())}")
+    try:
+        with span("db_chat_lookup", endpoint, request.domain):
+            chat_info = await db.get_chat_info(request.chat_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
+    if chat_info is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return PERSONALITIES[request.domain]
+
+async def admit_chat_turn(request: ChatRequest, http_request: Request):
+    """Admit a checked chat turn before anything is stored; None when admission control is off"""
+    if admission is None:
+        return None
+    # The history is not read yet, so reserve for the new message and a full
+    # reply; the ticket is settled against the real usage on release
+    tokens = context_builder.count_tokens(request.message) + MAX_COMPLETION_TOKENS
+    client = http_request.client.host if http_request.client else "unknown"
+    try:
+        return await admission.admit(client, request.chat_id, tokens)
+    except Rejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+
+def model_error(e: Exception) -> HTTPException:
+    """Map a failed chat turn to an error response; provider 429s stay 429s"""
+    retry_after = provider_retry_after(e)
+    if retry_after is None:
+        return HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
+    if admission is not None:
+        admission.provider_rate_limited(retry_after)
+    return HTTPException(status_code=429, detail="Model provider rate limit reached; try again later",
+                         headers=retry_after_headers(retry_after))
+
+async def prepare_chat_turn(request: ChatRequest, personality: Dict, endpoint: str):
+    """Store the user message of a checked chat turn and build the model prompt"""
+    # Replies still queued for this chat must land before we read its history
+    if write_behind is not None:
+        await write_behind.wait_for_chat(request.chat_id)
+    
+    # Add the user message and read recent history in one round trip; the
+    # chat may still have been deleted since check_chat_turn
+    with span("db_begin_turn", endpoint, request.domain):
+        turn = await db.begin_turn(request.chat_id, request.message,
+                                   token_count=context_builder.count_tokens(request.message),
+                                   context_limit=context_builder.page_size)
+    if turn is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    
+    # Prepare messages for OpenAI from as much recent history as the budget allows
+    with span("context_build", endpoint, request.domain):
+        openai_messages = await context_builder.build(request.chat_id, personality["system_prompt"], rows=turn["recent"],
+                                                      summary=turn["summary"])
+    
+    return openai_messages, turn["message"]
+
+def lookup_cached_response(request: ChatRequest, openai_messages: List[Dict]):
+    """Return (cache_key, cached_response); the key is None when the cache is skipped"""
+    if response_cache is None or response_cache.should_bypass(TEMPERATURE, request.fresh):
+        return None, None
+    cache_key = response_cache.make_key(OPENAI_MODEL, openai_messages,
+                                        max_tokens=MAX_COMPLETION_TOKENS, temperature=TEMPERATURE)
+    return cache_key, response_cache.get(cache_key)
+
+async def save_reply(chat_id: int, ai_response: str, personality: Dict) -> Optional[Dict]:
+    """Store an assistant reply now, or queue it when write-behind is enabled.
+
+    Returns the stored row's id and created_at, or None if it was queued.
+    """
+    token_count = context_builder.count_tokens(ai_response)
+    if write_behind is not None:
+        await write_behind.enqueue(chat_id, "assistant", ai_response, personality["name"],
+                                   personality["color"], token_count=token_count)
+        return None
+    return await db.finish_turn(chat_id, ai_response, personality["name"], personality["color"],
+                             token_count=token_count)
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """Main chat endpoint"""
+    personality = await check_chat_turn(request, "/chat")
+    ticket = await admit_chat_turn(request, http_request)
     try:
-        # Validate domain
-        if request.domain not in PERSONALITIES:
-            raise HTTPException(status_code=400, detail=f"Invalid domain. Available: {list(PERSONALITIES.keys())}")
-        
-        # Get personality info
-        personality = PERSONALITIES[request.domain]
-        
-        # Verify chat exists
-        chat_info = db.get_chat_info(request.chat_id)
-        if not chat_info:
-            raise HTTPException(status_code=404, detail="Chat not found")
+        openai_messages, user_message = await prepare_chat_turn(request, personality, "/chat")
         
-        # Add user message to database
-        db.add_message(request.chat_id, "user", request.message)
+        cache_key, ai_response = lookup_cached_response(request, openai_messages)
+        used_tokens = 0
+        if ai_response is None:
+            # Get response from OpenAI
+            with span("model_total", "/chat", request.domain):
+                response = await get_openai_client().chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=openai_messages,
+                    max_tokens=MAX_COMPLETION_TOKENS,
+                    temperature=TEMPERATURE
+                )
+            
+            ai_response = response.choices[0].message.content
+            if response.usage is not None:
+                prompt_tokens, completion_tokens = response.usage.prompt_tokens, response.usage.completion_tokens
+            else:
+                prompt_tokens = context_builder.count_prompt_tokens(openai_messages)
+                completion_tokens = context_builder.count_tokens(ai_response)
+            observe_tokens("/chat", request.domain, prompt_tokens, completion_tokens)
+            used_tokens = prompt_tokens + completion_tokens
+            if cache_key is not None:
+                response_cache.set(cache_key, ai_response)
         
-        # Get recent conversation history for context
-        messages = db.get_chat_messages(request.chat_id)
-        
-        # Prepare messages for OpenAI
-        openai_messages = [
-            {
-                "role": "system",
-                "content": personality["system_prompt"]
-            }
-        ]
-        
-        # Add recent conversation history (last 10 messages to avoid token limits)
-        recent_messages = messages[-10:]
-        for msg in recent_messages:
-            openai_messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-        
-        # Get response from OpenAI
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=openai_messages,
-            max_tokens=500,
-            temperature=0.8
-        )
-        
-        ai_response = response.choices[0].message.content
+        # The model call is done; free its slot before storing the reply
+        if ticket is not None:
+            ticket.release(used_tokens)
         
         # Add AI response to database
-        db.add_message(request.chat_id, "assistant", ai_response, personality["name"], personality["color"])
+        with span("db_save_reply", "/chat", request.domain):
+            reply = await save_reply(request.chat_id, ai_response, personality)
         
         return ChatResponse(
             response=ai_response,
             personality=personality["name"],
             chat_id=request.chat_id,
-            color=personality["color"]
+            color=personality["color"],
+            user_message_id=user_message["id"],
+            user_created_at=user_message["created_at"],
+            message_id=reply["id"] if reply else None,
+            created_at=reply["created_at"] if reply else None
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
+        raise model_error(e)
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse that frees its admission slot and runs ``cleanup``
+    however the response ends, including a client that disconnects before
+    the body starts and so before the body generator ever runs"""
+
+    def __init__(self, content, ticket, cleanup=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.ticket is not None:
+                self.ticket.release()
+            if self.cleanup is not None:
+                await self.cleanup()
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Chat endpoint that streams tokens as Server-Sent Events.
+
+    Emits a ``start`` event, one ``token`` event per content delta and a final
+    ``done`` event once the assistant reply has been stored. If the client
+    disconnects first, even before the body starts, the upstream completion
+    is closed, the partial reply is dropped and the user's message is
+    deleted again so the chat is not left with an unanswered turn. Errors
+    are reported with an ``error`` event and keep the message, as ``/chat``
+    does.
+    """
+    personality = await check_chat_turn(request, "/chat/stream")
+    ticket = await admit_chat_turn(request, http_request)
+    try:
+        openai_messages, user_message = await prepare_chat_turn(request, personality, "/chat/stream")
+        cache_key, cached_response = lookup_cached_response(request, openai_messages)
+        stream = None
+        model_started = time.perf_counter()
+        if cached_response is None:
+            stream = await get_openai_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=openai_messages,
+                max_tokens=MAX_COMPLETION_TOKENS,
+                temperature=TEMPERATURE,
+                stream=True
+            )
+    except Exception as e:
+        if ticket is not None:
+            ticket.release()
+        if isinstance(e, HTTPException):
+            raise
+        raise model_error(e)
+    
+    # Set once the client has been sent the reply or an error
+    settled = False
+
+    async def finish_stream():
+        """Close the model stream and roll back the user message of an abandoned turn"""
+        if stream is not None:
+            await stream.close()
+        if not settled:
+            try:
+                await db.delete_message(user_message["id"])
+            except Exception as e:
+                print(f"Failed to remove unanswered message {user_message['id']}: {e}")
+    
+    async def event_stream():
+        nonlocal settled
+        parts = []
+        # Cached replies cost no tokens; an interrupted stream keeps its reservation
+        used_tokens = 0 if stream is None else None
+        try:
+            yield sse_event("start", {
+                "personality": personality["name"],
+                "chat_id": request.chat_id,
+                "color": personality["color"]
+            })
+            if stream is None:
+                parts.append(cached_response)
+                yield sse_event("token", {"content": cached_response})
+            else:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        if not parts:
+                            observe_stage("model_ttft", time.perf_counter() - model_started,
+                                          "/chat/stream", request.domain)
+                        parts.append(token)
+                        yield sse_event("token", {"content": token})
+                observe_stage("model_total", time.perf_counter() - model_started,
+                              "/chat/stream", request.domain)
+                prompt_tokens = context_builder.count_prompt_tokens(openai_messages)
+                completion_tokens = context_builder.count_tokens("".join(parts))
+                observe_tokens("/chat/stream", request.domain, prompt_tokens, completion_tokens)
+                used_tokens = prompt_tokens + completion_tokens
+        except Exception as e:
+            settled = True
+            yield sse_event("error", {"detail": f"Error processing chat: {str(e)}"})
+            return
+        finally:
+            # Runs on normal completion, errors and client disconnects alike;
+            # closing the upstream stream stops generation we would discard
+            if stream is not None:
+                await stream.close()
+            if ticket is not None:
+                ticket.release(used_tokens)
+        
+        ai_response = "".join(parts)
+        if cache_key is not None and stream is not None:
+            response_cache.set(cache_key, ai_response)
+        try:
+            with span("db_save_reply", "/chat/stream", request.domain):
+                reply = await save_reply(request.chat_id, ai_response, personality)
+            settled = True
+        except Exception as e:
+            settled = True
+            yield sse_event("error", {"detail": f"Error saving response: {str(e)}"})
+            return
+        
+        yield sse_event("done", {
+            "response": ai_response,
+            "personality": personality["name"],
+            "chat_id": request.chat_id,
+            "color": personality["color"],
+            "user_message_id": user_message["id"],
+            "user_created_at": user_message["created_at"].isoformat(),
+            "message_id": reply["id"] if reply else None,
+            "created_at": reply["created_at"].isoformat() if reply else None
+        })
+    
+    return AdmittedStreamingResponse(
+        event_stream(),
+        ticket,
+        cleanup=finish_stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 if __name__ == "__main__":
     import uvicorn
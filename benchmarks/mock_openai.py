@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions API
+
+Answers POST /v1/chat/completions, streamed or not, after a fixed
+time-to-first-token and at a fixed token rate, so benchmark runs measure
+the backend rather than the network or the model.
+
+Usage:
+    python benchmarks/mock_openai.py --port 8100 --latency-ms 300 --tokens-per-second 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Each completion token is one of these words
+WORDS = ["Affirmative.", "Mission", "parameters", "acknowledged", "and", "target", "acquired", "now."]
+
+def create_app(latency_ms: float = 300, tokens_per_second: float = 50, completion_tokens: int = 60) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI")
+    app.state.requests = 0
+
+    def completion_words(max_tokens):
+        count = min(completion_tokens, max_tokens or completion_tokens)
+        return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+    def usage(messages, words):
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 4 for m in messages)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                "total_tokens": prompt_tokens + len(words)}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "requests": app.state.requests}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        words = completion_words(body.get("max_tokens"))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o")
+        token_delay = 1 / tokens_per_second if tokens_per_second > 0 else 0
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency_ms / 1000 + token_delay * len(words))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words).strip()},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage(body.get("messages", []), words),
+            }
+
+        async def events():
+            def chunk(delta, finish_reason=None):
+                return "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }) + "\n\n"
+
+            await asyncio.sleep(latency_ms / 1000)
+            yield chunk({"role": "assistant", "content": ""})
+            for word in words:
+                yield chunk({"content": word})
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+            yield chunk({}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=300, help="time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="0 sends every token at once")
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.tokens_per_second, args.completion_tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
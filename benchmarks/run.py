@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+SkyNetAI load test
+
+Starts the mock OpenAI server and the backend (backend:app) as
+subprocesses, seeds chats, then drives each endpoint at each concurrency
+level and prints throughput and latency percentiles as JSON.
+
+The backend uses a fresh SQLite file unless --database-url is given.
+Other backend settings (WRITE_BEHIND_ENABLED, RESPONSE_CACHE_ENABLED, ...)
+are taken from the environment.
+
+Usage:
+    python benchmarks/run.py
+    python benchmarks/run.py --concurrency 1 8 32 --duration 20 --output results.json
+    python benchmarks/run.py --database-url postgresql://localhost/skynet_bench
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["chat", "list_chats", "get_chat"]
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def summarize(endpoint: str, concurrency: int, latencies: List[float], errors: int, elapsed: float) -> Dict:
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+            "max": ms(latencies[-1]) if latencies else 0.0,
+        },
+    }
+
+def start_process(args: List[str], env: Dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable] + args, cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+async def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited early:\n{process.stderr.read().decode()}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+async def seed_chats(client: httpx.AsyncClient, chats: int, messages: int, domain: str) -> List[int]:
+    """Create chats, each with ``messages`` turns of history"""
+    chat_ids = []
+    for i in range(chats):
+        response = await client.post("/chats", json={"title": f"Benchmark {i}"})
+        response.raise_for_status()
+        chat_ids.append(response.json()["id"])
+
+    async def fill(chat_id):
+        for turn in range(messages):
+            response = await client.post("/chat", json={
+                "message": f"Seed message {turn}", "domain": domain, "chat_id": chat_id
+            })
+            response.raise_for_status()
+    await asyncio.gather(*(fill(chat_id) for chat_id in chat_ids))
+    return chat_ids
+
+def make_request(client: httpx.AsyncClient, endpoint: str, chat_ids: List[int], domain: str):
+    chat_id = random.choice(chat_ids)
+    if endpoint == "chat":
+        return client.post("/chat", json={
+            "message": f"Status report {random.randrange(1_000_000)}", "domain": domain, "chat_id": chat_id
+        })
+    if endpoint == "list_chats":
+        return client.get("/chats")
+    return client.get(f"/chats/{chat_id}")
+
+async def drive(client: httpx.AsyncClient, endpoint: str, concurrency: int, duration: float,
+                chat_ids: List[int], domain: str) -> Dict:
+    """Run ``concurrency`` closed-loop workers against one endpoint for ``duration`` seconds"""
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, endpoint, chat_ids, domain)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(endpoint, concurrency, latencies, errors, time.monotonic() - started)
+
+async def run(args) -> Dict:
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    backend_url = f"http://127.0.0.1:{args.backend_port}"
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "DATABASE_URL": database_url,
+        "DB_AUTO_MIGRATE": "1",
+    })
+    mock = start_process([
+        "benchmarks/mock_openai.py", "--port", str(args.mock_port),
+        "--latency-ms", str(args.latency_ms),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--completion-tokens", str(args.completion_tokens),
+    ], env)
+    backend = start_process([
+        "-m", "uvicorn", "backend:app", "--host", "127.0.0.1", "--port", str(args.backend_port),
+        "--log-level", "warning",
+    ], env)
+    try:
+        await wait_until_up(f"{mock_url}/health", mock)
+        await wait_until_up(f"{backend_url}/", backend)
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=backend_url, limits=limits, timeout=args.timeout) as client:
+            chat_ids = await seed_chats(client, args.chats, args.history, args.domain)
+            results = []
+            for concurrency in args.concurrency:
+                for endpoint in args.endpoints:
+                    if args.warmup:
+                        await drive(client, endpoint, concurrency, args.warmup, chat_ids, args.domain)
+                    result = await drive(client, endpoint, concurrency, args.duration, chat_ids, args.domain)
+                    results.append(result)
+                    print(f"{endpoint:<11} c={concurrency:<4} {result['throughput_rps']:>9.1f} req/s  "
+                          f"p50={result['latency_ms']['p50']}ms p99={result['latency_ms']['p99']}ms "
+                          f"errors={result['errors']}", file=sys.stderr)
+    finally:
+        for process in (backend, mock):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "config": {
+            "database": "sqlite" if database_url.startswith("sqlite") else "postgresql",
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "chats": args.chats,
+            "history_turns": args.history,
+            "mock_latency_ms": args.latency_ms,
+            "mock_tokens_per_second": args.tokens_per_second,
+            "mock_completion_tokens": args.completion_tokens,
+        },
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per endpoint and level")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of unmeasured load before each run")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--history", type=int, default=10, help="turns of history seeded per chat")
+    parser.add_argument("--domain", default="tactical")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--mock-port", type=int, default=8100)
+    parser.add_argument("--backend-port", type=int, default=8101)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+SkyNetAI cold-start benchmark
+
+Starts a fresh interpreter per run, the way a serverless cold start does,
+and times each phase of bringing the backend up:
+
+    import_ms         import backend (module-level setup included)
+    startup_ms        application lifespan startup
+    first_request_ms  GET / - no database or model access
+    first_query_ms    GET /chats - opens the database and checks the schema
+    total_ms          interpreter launch to the end of the first query
+
+Each run uses a fresh SQLite file unless --database-url is given. Prints
+median/p95/max per phase as JSON.
+
+Usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --output startup.json
+    python benchmarks/startup.py --importtime 15     # also list the slowest imports
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from run import ROOT, percentile
+
+PHASES = ["import_ms", "startup_ms", "first_request_ms", "first_query_ms", "total_ms"]
+
+# Runs in the child interpreter. The test client is imported after backend
+# and outside the timed phases, so only the backend's own cost is measured.
+CHILD = """
+import json, time
+started = time.perf_counter()
+import backend
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(backend.app)
+lifespan_started = time.perf_counter()
+with client:
+    ready = time.perf_counter()
+    client.get("/").raise_for_status()
+    first_request = time.perf_counter()
+    client.get("/chats").raise_for_status()
+    first_query = time.perf_counter()
+ms = lambda seconds: round(seconds * 1000, 2)
+print(json.dumps({
+    "import_ms": ms(imported - started),
+    "startup_ms": ms(ready - lifespan_started),
+    "first_request_ms": ms(first_request - ready),
+    "first_query_ms": ms(first_query - first_request),
+}))
+"""
+
+def child_env(database_url: str) -> Dict:
+    env = dict(os.environ)
+    env.update({"OPENAI_API_KEY": env.get("OPENAI_API_KEY", "benchmark"), "DATABASE_URL": database_url})
+    return env
+
+def run_once(database_url: str) -> Dict:
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=child_env(database_url),
+                            capture_output=True, text=True)
+    total = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"backend failed to start:\n{result.stderr}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["total_ms"] = round(total * 1000, 2)
+    return timings
+
+def slowest_imports(database_url: str, top: int) -> List[Dict]:
+    """The modules backend imports directly, slowest first, from python -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend"], cwd=ROOT,
+                            env=child_env(database_url), capture_output=True, text=True)
+    children = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)", line)
+        if not match:
+            continue
+        # importtime prints children before their parent, indented two more spaces
+        depth = (len(match.group(2)) - 1) // 2
+        if depth == 1:
+            children.append((match.group(3), int(match.group(1))))
+        elif depth == 0:
+            if match.group(3) == "backend":
+                break
+            children = []
+    ranked = sorted(children, key=lambda item: item[1], reverse=True)[:top]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 2)} for name, us in ranked]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file per run")
+    parser.add_argument("--importtime", type=int, metavar="N", default=0,
+                        help="also report the N slowest modules backend imports")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+        runs.append(run_once(database_url))
+        print(f"run {i + 1:<3} " + "  ".join(f"{phase}={runs[-1][phase]}" for phase in PHASES), file=sys.stderr)
+
+    report = {
+        "config": {
+            "runs": args.runs,
+            "database": "postgresql" if args.database_url and not args.database_url.startswith("sqlite")
+                        else "sqlite",
+            "python": sys.version.split()[0],
+        },
+        "results": {
+            phase: {
+                "p50": percentile(sorted(run[phase] for run in runs), 50),
+                "p95": percentile(sorted(run[phase] for run in runs), 95),
+                "max": max(run[phase] for run in runs),
+            }
+            for phase in PHASES
+        },
+    }
+    if args.importtime:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+        report["slowest_imports"] = slowest_imports(database_url, args.importtime)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
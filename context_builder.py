@@ -0,0 +1,178 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+# Context window sizes in tokens
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+
+# Prompt token budget per model. Kept well below the window: every prompt
+# token is paid for on every turn. CONTEXT_TOKEN_BUDGETS overrides single
+# models ("gpt-4o=12000,gpt-4=3000"); CONTEXT_TOKEN_BUDGET overrides every
+# model not named there.
+MODEL_CONTEXT_BUDGETS = {
+    "gpt-4o": 8000,
+    "gpt-4o-mini": 8000,
+    "gpt-4-turbo": 8000,
+    "gpt-4": 4000,
+    "gpt-3.5-turbo": 4000,
+}
+
+DEFAULT_CONTEXT_BUDGET = 4000
+
+# Chat format overhead: each message is wrapped in role/separator tokens and
+# every reply is primed with a few more
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+_encodings = {}
+
+# tiktoken is imported on the first count rather than at startup; False once
+# it is known not to be installed
+tiktoken = None
+
+def _get_encoding(model: str):
+    global tiktoken
+    if tiktoken is None:
+        try:
+            import tiktoken
+        except ImportError:
+            tiktoken = False
+    if tiktoken is False:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return _encodings[model]
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Count the tokens in a message body.
+
+    Uses tiktoken when it is installed, otherwise a conservative estimate of
+    one token per three characters.
+    """
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text or ""))
+    return len(text or "") // 3 + 1
+
+def get_budget_overrides() -> Dict[str, int]:
+    """Per-model budgets from CONTEXT_TOKEN_BUDGETS, given as model=tokens pairs"""
+    overrides = {}
+    for item in os.environ.get("CONTEXT_TOKEN_BUDGETS", "").split(","):
+        if item.strip():
+            model, _, budget = item.partition("=")
+            overrides[model.strip()] = int(budget)
+    return overrides
+
+def get_context_budget(model: str, max_completion_tokens: int = 0) -> int:
+    """Get the prompt token budget for a model, capped by its context window"""
+    budget = (get_budget_overrides().get(model)
+              or int(os.environ.get("CONTEXT_TOKEN_BUDGET", "0"))
+              or MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET))
+    window = MODEL_CONTEXT_WINDOWS.get(model)
+    if window is not None:
+        budget = min(budget, window - max_completion_tokens)
+    return budget
+
+class ContextBuilder:
+    """Assemble the prompt for a chat turn within a token budget.
+
+    Messages are read newest-first in pages using ``get_recent_messages`` and
+    added until the next one would exceed the budget, so the rows read per
+    turn depend on the budget rather than the length of the chat. Token
+    counts are taken from ``messages.token_count``; rows stored before that
+    column existed are counted once and written back.
+
+    With a ``summarizer``, the chat's stored summary is sent after the
+    system prompt and history stops at the last message it covers.
+    """
+
+    def __init__(self, db, model: str, max_completion_tokens: int = 0,
+                 budget: Optional[int] = None, page_size: int = 50, summarizer=None):
+        self.db = db
+        self.model = model
+        self.budget = budget if budget is not None else get_context_budget(model, max_completion_tokens)
+        self.page_size = page_size
+        self.summarizer = summarizer
+
+    def count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def count_prompt_tokens(self, openai_messages: List[Dict]) -> int:
+        """Estimate the prompt tokens of a built message list"""
+        return sum(self.count_tokens(msg["content"]) + TOKENS_PER_MESSAGE
+                   for msg in openai_messages) + TOKENS_PER_REPLY
+
+    def select(self, rows: List[Dict], remaining: int, backfill: List,
+               take_first: bool = False) -> Tuple[List[Dict], int, bool]:
+        """Take rows (newest first) while they fit; returns (taken, remaining, exhausted)"""
+        taken = []
+        for row in rows:
+            tokens = row.get("token_count")
+            if tokens is None:
+                tokens = self.count_tokens(row["content"])
+                row["token_count"] = tokens
+                if row.get("id") is not None:
+                    backfill.append((row["id"], tokens))
+            cost = tokens + TOKENS_PER_MESSAGE
+            # The newest message is always sent, even if it alone is too big
+            if cost > remaining and not (take_first and not taken):
+                return taken, remaining, True
+            taken.append(row)
+            remaining -= cost
+        return taken, remaining, False
+
+    async def build(self, chat_id: int, system_prompt: str, rows: Optional[List[Dict]] = None,
+                    summary: Optional[Dict] = None) -> List[Dict]:
+        """Build the OpenAI message list for a chat.
+
+        ``rows`` may hold the newest ``page_size`` rows (newest first) when
+        the caller already read them, e.g. from ``begin_turn``; older pages
+        are fetched only if those leave budget unused. The chat's
+        ``summary`` must then be passed along with them.
+        """
+        remaining = self.budget - self.count_tokens(system_prompt) - TOKENS_PER_MESSAGE - TOKENS_PER_REPLY
+        selected = []
+        backfill = []
+        page_size = self.page_size
+
+        if not self.summarizer:
+            summary = None
+        elif rows is None:
+            summary = await self.summarizer.get_summary(chat_id)
+        covered = 0
+        if summary:
+            covered = summary["covered_message_id"]
+            remaining -= summary["token_count"] + TOKENS_PER_MESSAGE
+
+        unsummarized = 0
+        if rows is None:
+            rows = await self.db.get_recent_messages(chat_id, page_size)
+        while True:
+            uncovered = [row for row in rows if row["id"] > covered]
+            unsummarized += len(uncovered)
+            taken, remaining, exhausted = self.select(uncovered, remaining, backfill, take_first=not selected)
+            selected.extend(taken)
+            if exhausted or len(uncovered) < page_size or not rows:
+                break
+            page_size = min(page_size * 2, 500)
+            rows = await self.db.get_recent_messages(chat_id, page_size, before=rows[-1]["id"])
+
+        if backfill:
+            await self.db.set_token_counts(backfill)
+        if self.summarizer and self.summarizer.should_refresh(unsummarized, exhausted):
+            self.summarizer.schedule(chat_id)
+
+        openai_messages = [{"role": "system", "content": system_prompt}]
+        if summary:
+            openai_messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary['content']}"})
+        for msg in reversed(selected):
+            openai_messages.append({"role": msg["role"], "content": msg["content"]})
+        return openai_messages
@@ -1,59 +1,288 @@
 import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
+import io
 import json
+from migrations import migrate, get_applied_versions, pending_versions
+from storage import StorageBackend, split_summary
+from metrics import DB_CONNECT_DURATION, METRICS_ENABLED, timed_queries
 
-class DatabaseManager:
-    def __init__(self):
+def _copy_csv_field(value) -> str:
+    """One COPY CSV field: None as the unquoted NULL marker, anything else
+    quoted, so an empty string is not read back as NULL"""
+    if value is None:
+        return "\\N"
+    return '"' + str(value).replace('"', '""') + '"'
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool.
+
+    Connections are handed out LIFO so the warmest connection is reused first.
+    On checkout a connection that has been idle longer than ``check_idle``
+    seconds is pinged with ``SELECT 1``; connections older than
+    ``max_lifetime`` seconds are closed instead of being reused.
+    """
+
+    def __init__(self, connection_string: str, min_size: int = 1, max_size: int = 10,
+                 max_lifetime: float = 1800.0, timeout: float = 30.0, check_idle: float = 5.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.check_idle = check_idle
+
+        self._cond = threading.Condition()
+        # Idle connections as (conn, returned_at)
+        self._idle = deque()
+        # created_at of every open connection, keyed by id(conn)
+        self._born = {}
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_waits": 0,
+            "checkout_wait_seconds": 0.0,
+            "checkout_timeouts": 0,
+            "health_check_failures": 0,
+            "expired": 0,
+        }
+
+    def _connect(self):
+        conn = psycopg2.connect(self.connection_string)
+        with self._cond:
+            self._born[id(conn)] = time.monotonic()
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        """Close a connection and release its slot (caller holds the lock)"""
+        self._born.pop(id(conn), None)
+        self._size -= 1
+        self._stats["connections_closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._cond.notify()
+
+    def _expired(self, conn) -> bool:
+        born = self._born.get(id(conn))
+        return born is not None and time.monotonic() - born > self.max_lifetime
+
+    def _healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def open(self):
+        """Pre-open connections up to ``min_size``"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self):
+        """Check a connection out of the pool, blocking up to ``timeout``"""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = time.monotonic()
+        while True:
+            conn = None
+            idle_since = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        if self._expired(conn):
+                            self._stats["expired"] += 1
+                            self._discard(conn)
+                            conn = None
+                            continue
+                        break
+                    if self._size < self.max_size:
+                        # Reserve a slot and connect outside the lock
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["checkout_timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(conn, idle_since):
+                with self._cond:
+                    self._stats["health_check_failures"] += 1
+                    self._discard(conn)
+                continue
+
+            with self._cond:
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["checkout_waits"] += 1
+                    self._stats["checkout_wait_seconds"] += time.monotonic() - wait_started
+            return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool"""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            if discard or conn.closed or self._closed or self._expired(conn):
+                if not discard and not conn.closed and self._expired(conn):
+                    self._stats["expired"] += 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commit on success, roll back on error"""
+        started = time.perf_counter()
+        conn = self.getconn()
+        if METRICS_ENABLED:
+            DB_CONNECT_DURATION.observe(time.perf_counter() - started)
+        discard = False
+        try:
+            yield conn
+            if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def stats(self) -> Dict:
+        """Snapshot of pool sizes and counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+            })
+            return stats
+
+    def close(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+@timed_queries
+class DatabaseManager(StorageBackend):
+    def __init__(self, min_size: int = None, max_size: int = None):
         self.connection_string = os.environ.get("DATABASE_URL")
         if self.connection_string and self.connection_string.startswith("postgres://"):
             # Convert postgres:// to postgresql:// for psycopg2 compatibility
             self.connection_string = self.connection_string.replace("postgres://", "postgresql://", 1)
+        self.pool = ConnectionPool(
+            self.connection_string,
+            min_size=min_size if min_size is not None else int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+            max_size=max_size if max_size is not None else int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            max_lifetime=float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800")),
+            timeout=float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+            check_idle=float(os.environ.get("DB_POOL_CHECK_IDLE", "5")),
+        )
         self.init_database()
     
     def get_connection(self):
-        return psycopg2.connect(self.connection_string)
+        """Borrow a pooled connection for the duration of a ``with`` block"""
+        return self.pool.connection()
+
+    def ping(self):
+        """Run a trivial query; raises if the database is unreachable"""
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+
+    def pool_stats(self) -> Dict:
+        """Get connection pool statistics"""
+        return self.pool.stats()
+
+    def close(self):
+        """Close all pooled connections"""
+        self.pool.close()
     
     def init_database(self):
-        """Initialize database tables"""
+        """Check the schema is migrated and open the pool.
+
+        Schema changes live in migrations.py; set DB_AUTO_MIGRATE=1 to apply
+        pending migrations here instead of via ``python migrations.py``.
+        """
         try:
+            if os.environ.get("DB_AUTO_MIGRATE") == "1":
+                migrate(self.connection_string)
             with self.get_connection() as conn:
                 with conn.cursor() as cur:
-                    # Create chats table
-                    cur.execute("""
-                        CREATE TABLE IF NOT EXISTS chats (
-                            id SERIAL PRIMARY KEY,
-                            title VARCHAR(255) NOT NULL,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                    """)
-                    
-                    # Create messages table
-                    cur.execute("""
-                        CREATE TABLE IF NOT EXISTS messages (
-                            id SERIAL PRIMARY KEY,
-                            chat_id INTEGER REFERENCES chats(id) ON DELETE CASCADE,
-                            role VARCHAR(50) NOT NULL,
-                            content TEXT NOT NULL,
-                            personality VARCHAR(100),
-                            color VARCHAR(20),
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                    """)
-                    
-                    # Create index for better performance
-                    cur.execute("""
-                        CREATE INDEX IF NOT EXISTS idx_messages_chat_id 
-                        ON messages(chat_id);
-                    """)
-                    
-                    conn.commit()
+                    pending = pending_versions(get_applied_versions(cur))
+            if pending:
+                print(f"Database schema is behind: migrations {pending} pending. Run: python migrations.py")
+            self.pool.open()
         except Exception as e:
+            # Leave DATABASE_URL unset to use the embedded SQLite backend instead
             print(f"Database initialization failed: {e}")
-            # For now, continue without database - will use in-memory fallback
     
     def create_chat(self, title: str) -> int:
         """Create a new chat session"""
@@ -73,15 +302,79 @@ class DatabaseManager:
         with self.get_connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
-                    SELECT c.id, c.title, c.created_at, c.updated_at,
-                           COUNT(m.id) as message_count
-                    FROM chats c
-                    LEFT JOIN messages m ON c.id = m.chat_id
-                    GROUP BY c.id, c.title, c.created_at, c.updated_at
-                    ORDER BY c.updated_at DESC
+                    SELECT id, title, created_at, updated_at, message_count, last_message_at
+                    FROM chats
+                    ORDER BY updated_at DESC, id DESC
                 """)
                 return [dict(row) for row in cur.fetchall()]
     
+    def get_chats_page(self, limit: int, before: Tuple[datetime, int] = None,
+                       after: Tuple[datetime, int] = None) -> Tuple[List[Dict], bool]:
+        """Get one page of chats ordered by (updated_at, id) descending.
+
+        ``after``/``before`` are the (updated_at, id) keys of the row the
+        previous page ended/started at. Returns the rows and whether more
+        rows exist in the direction of travel.
+        """
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                if before is not None:
+                    cur.execute("""
+                        SELECT id, title, created_at, updated_at, message_count, last_message_at
+                        FROM chats
+                        WHERE (updated_at, id) > (%s, %s)
+                        ORDER BY updated_at ASC, id ASC
+                        LIMIT %s
+                    """, (before[0], before[1], limit + 1))
+                    rows = cur.fetchall()
+                    page = [dict(row) for row in rows[:limit]]
+                    page.reverse()
+                else:
+                    updated_at, chat_id = after if after is not None else (None, None)
+                    cur.execute("""
+                        SELECT id, title, created_at, updated_at, message_count, last_message_at
+                        FROM chats
+                        WHERE %s::timestamp IS NULL OR (updated_at, id) < (%s, %s)
+                        ORDER BY updated_at DESC, id DESC
+                        LIMIT %s
+                    """, (updated_at, updated_at, chat_id, limit + 1))
+                    rows = cur.fetchall()
+                    page = [dict(row) for row in rows[:limit]]
+                return page, len(rows) > limit
+    
+    def get_messages_page(self, chat_id: int, limit: int, before: int = None,
+                          after: int = None) -> Tuple[List[Dict], bool]:
+        """Get one page of a chat's messages in chronological order.
+
+        Without cursors this is the newest page. ``before``/``after`` are
+        message ids; returns the rows and whether more rows exist in the
+        direction of travel (older for ``before``, newer for ``after``).
+        """
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                if after is not None:
+                    cur.execute("""
+                        SELECT id, role, content, personality, color, created_at
+                        FROM messages
+                        WHERE chat_id = %s AND id > %s
+                        ORDER BY id ASC
+                        LIMIT %s
+                    """, (chat_id, after, limit + 1))
+                    rows = cur.fetchall()
+                    page = [dict(row) for row in rows[:limit]]
+                else:
+                    cur.execute("""
+                        SELECT id, role, content, personality, color, created_at
+                        FROM messages
+                        WHERE chat_id = %s AND (%s::integer IS NULL OR id < %s)
+                        ORDER BY id DESC
+                        LIMIT %s
+                    """, (chat_id, before, before, limit + 1))
+                    rows = cur.fetchall()
+                    page = [dict(row) for row in rows[:limit]]
+                    page.reverse()
+                return page, len(rows) > limit
+    
     def get_chat_messages(self, chat_id: int) -> List[Dict]:
         """Get all messages for a specific chat"""
         with self.get_connection() as conn:
@@ -94,25 +387,297 @@ class DatabaseManager:
                 """, (chat_id,))
                 return [dict(row) for row in cur.fetchall()]
     
+    def get_recent_messages(self, chat_id: int, limit: int, before: int = None) -> List[Dict]:
+        """Get up to ``limit`` messages of a chat, newest first, older than message id ``before``"""
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT id, role, content, token_count
+                    FROM messages
+                    WHERE chat_id = %s AND (%s::integer IS NULL OR id < %s)
+                    ORDER BY id DESC
+                    LIMIT %s
+                """, (chat_id, before, before, limit))
+                return [dict(row) for row in cur.fetchall()]
+    
+    def search_messages(self, query: str, limit: int, chat_id: int = None, role: str = None,
+                        personality: str = None, after: Tuple[float, int] = None) -> Tuple[List[Dict], bool]:
+        """Full-text search over messages, best matches first"""
+        after_rank, after_id = after if after is not None else (None, None)
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT m.id, m.chat_id, c.title AS chat_title, m.role, m.personality, m.color,
+                           m.created_at, page.rank,
+                           ts_headline('english', m.content, page.query,
+                                       'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2') AS snippet
+                    FROM (
+                        SELECT id, query, rank
+                        FROM (
+                            SELECT m.id, q.query, ts_rank_cd(m.search_vector, q.query) AS rank
+                            FROM messages m, websearch_to_tsquery('english', %(query)s) AS q(query)
+                            WHERE m.search_vector @@ q.query
+                              AND (%(chat_id)s::integer IS NULL OR m.chat_id = %(chat_id)s)
+                              AND (%(role)s::text IS NULL OR m.role = %(role)s)
+                              AND (%(personality)s::text IS NULL OR m.personality = %(personality)s)
+                        ) hits
+                        WHERE %(after_rank)s::real IS NULL OR (rank, id) < (%(after_rank)s::real, %(after_id)s::integer)
+                        ORDER BY rank DESC, id DESC
+                        LIMIT %(limit)s
+                    ) page
+                    JOIN messages m ON m.id = page.id
+                    JOIN chats c ON c.id = m.chat_id
+                    ORDER BY page.rank DESC, page.id DESC
+                """, {"query": query, "chat_id": chat_id, "role": role, "personality": personality,
+                      "after_rank": after_rank, "after_id": after_id, "limit": limit + 1})
+                rows = cur.fetchall()
+                return [dict(row) for row in rows[:limit]], len(rows) > limit
+    
+    def get_chat_summary(self, chat_id: int) -> Optional[Dict]:
+        """Get a chat's stored summary and the last message id it covers"""
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT content, covered_message_id, token_count, updated_at
+                    FROM chat_summaries
+                    WHERE chat_id = %s
+                """, (chat_id,))
+                row = cur.fetchone()
+                return dict(row) if row else None
+    
+    def save_chat_summary(self, chat_id: int, content: str, covered_message_id: int, token_count: int):
+        """Store a chat's summary unless a newer one is already stored"""
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO chat_summaries (chat_id, content, covered_message_id, token_count)
+                    SELECT id, %s, %s, %s FROM chats WHERE id = %s
+                    ON CONFLICT (chat_id) DO UPDATE
+                    SET content = EXCLUDED.content,
+                        covered_message_id = EXCLUDED.covered_message_id,
+                        token_count = EXCLUDED.token_count,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE chat_summaries.covered_message_id < EXCLUDED.covered_message_id
+                """, (content, covered_message_id, token_count, chat_id))
+                conn.commit()
+    
+    def set_token_counts(self, counts: List[tuple]):
+        """Store token counts given as (message_id, token_count) pairs"""
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany("""
+                    UPDATE messages SET token_count = %s WHERE id = %s
+                """, [(token_count, message_id) for message_id, token_count in counts])
+                conn.commit()
+    
     def add_message(self, chat_id: int, role: str, content: str, 
-                   personality: str = None, color: str = None):
+                   personality: str = None, color: str = None, token_count: int = None):
         """Add a message to a chat"""
         with self.get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
-                    INSERT INTO messages (chat_id, role, content, personality, color)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (chat_id, role, content, personality, color))
+                    INSERT INTO messages (chat_id, role, content, personality, color, token_count)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (chat_id, role, content, personality, color, token_count))
                 
-                # Update chat's updated_at timestamp
+                # Update chat's updated_at timestamp and counters
                 cur.execute("""
                     UPDATE chats 
-                    SET updated_at = CURRENT_TIMESTAMP 
+                    SET updated_at = CURRENT_TIMESTAMP,
+                        message_count = message_count + 1,
+                        last_message_at = CURRENT_TIMESTAMP
                     WHERE id = %s
                 """, (chat_id,))
                 
                 conn.commit()
     
+    def add_messages_batch(self, messages: List[Dict]):
+        """Insert many messages with one statement and bump each chat once.
+
+        Messages whose chat no longer exists are skipped.
+        """
+        if not messages:
+            return
+        counts = {}
+        for message in messages:
+            counts[message["chat_id"]] = counts.get(message["chat_id"], 0) + 1
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(cur, """
+                    INSERT INTO messages (chat_id, role, content, personality, color, token_count)
+                    SELECT v.chat_id, v.role, v.content, v.personality, v.color, v.token_count
+                    FROM (VALUES %s) AS v(ord, chat_id, role, content, personality, color, token_count)
+                    JOIN chats c ON c.id = v.chat_id
+                    ORDER BY v.ord
+                """, [(i, m["chat_id"], m["role"], m["content"], m.get("personality"), m.get("color"),
+                       m.get("token_count")) for i, m in enumerate(messages)],
+                    template="(%s, %s::integer, %s, %s, %s, %s, %s::integer)", page_size=len(messages))
+                
+                # One counter update per chat, not per message
+                execute_values(cur, """
+                    UPDATE chats c
+                    SET updated_at = CURRENT_TIMESTAMP,
+                        message_count = c.message_count + v.added,
+                        last_message_at = CURRENT_TIMESTAMP
+                    FROM (VALUES %s) AS v(chat_id, added)
+                    WHERE c.id = v.chat_id
+                """, list(counts.items()), template="(%s::integer, %s::integer)")
+                conn.commit()
+    
+    def export_rows(self, itersize: int = 1000) -> Iterator[Dict]:
+        """Yield every chat joined with its messages, ordered by chat then message id.
+
+        Reads through a server-side (named) cursor inside one read-only snapshot.
+        """
+        with self.get_connection() as conn:
+            # Set on the transaction rather than the session, so a consumer
+            # that stops early leaves nothing to reset: the pool rolls back
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            with conn.cursor(name="skynet_export", cursor_factory=RealDictCursor) as cur:
+                cur.itersize = itersize
+                cur.execute("""
+                    SELECT c.id AS chat_id, c.title, c.created_at AS chat_created_at, c.updated_at AS chat_updated_at,
+                           m.id AS message_id, m.role, m.content, m.personality, m.color, m.token_count, m.created_at
+                    FROM chats c
+                    LEFT JOIN messages m ON m.chat_id = c.id
+                    ORDER BY c.id, m.id
+                """)
+                for row in cur:
+                    yield dict(row)
+            conn.commit()
+    
+    def import_chat(self, title: str, created_at: datetime = None, updated_at: datetime = None) -> int:
+        """Create a chat from an export, keeping its timestamps"""
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO chats (title, created_at, updated_at)
+                    VALUES (%s, COALESCE(%s, CURRENT_TIMESTAMP), COALESCE(%s, CURRENT_TIMESTAMP))
+                    RETURNING id
+                """, (title, created_at, updated_at))
+                chat_id = cur.fetchone()[0]
+                conn.commit()
+                return chat_id
+    
+    def import_messages(self, messages: List[Dict]):
+        """Bulk-load exported messages with COPY and update their chats' counters"""
+        if not messages:
+            return
+        columns = ["chat_id", "role", "content", "personality", "color", "token_count", "created_at"]
+        counters = {}
+        buffer = io.StringIO()
+        for message in messages:
+            count, last = counters.get(message["chat_id"], (0, message["created_at"]))
+            counters[message["chat_id"]] = (count + 1, max(last, message["created_at"]))
+            buffer.write(",".join(_copy_csv_field(message[c]) for c in columns) + "\n")
+        buffer.seek(0)
+        # One transaction: a failed batch leaves neither messages nor counters behind
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.copy_expert(
+                    f"COPY messages ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    buffer,
+                )
+                execute_values(cur, """
+                    UPDATE chats c
+                    SET message_count = c.message_count + v.added,
+                        last_message_at = GREATEST(c.last_message_at, v.last_message_at)
+                    FROM (VALUES %s) AS v(chat_id, added, last_message_at)
+                    WHERE c.id = v.chat_id
+                """, [(chat_id, count, last) for chat_id, (count, last) in counters.items()],
+                    template="(%s::integer, %s::integer, %s::timestamp)")
+            conn.commit()
+    
+    def begin_turn(self, chat_id: int, content: str, token_count: int = None,
+                   context_limit: int = 50) -> Optional[Dict]:
+        """Store a user message and read back recent context in one statement.
+
+        Bumps the chat's timestamp and counters, inserts the message and
+        returns ``{"message": <new row>, "recent": <up to context_limit rows,
+        newest first, including the new one>, "summary": <the chat's stored
+        summary or None>}``, or None if the chat does not exist.
+        """
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    WITH chat AS (
+                        UPDATE chats
+                        SET updated_at = CURRENT_TIMESTAMP,
+                            message_count = message_count + 1,
+                            last_message_at = CURRENT_TIMESTAMP
+                        WHERE id = %(chat_id)s
+                        RETURNING id
+                    ), inserted AS (
+                        INSERT INTO messages (chat_id, role, content, token_count)
+                        SELECT id, 'user', %(content)s, %(token_count)s FROM chat
+                        RETURNING id, chat_id, role, content, token_count, created_at
+                    )
+                    -- The chat's summary rides along on the new row only
+                    SELECT i.id, i.role, i.content, i.token_count, i.created_at,
+                           s.content AS summary_content, s.covered_message_id AS summary_covered_message_id,
+                           s.token_count AS summary_token_count
+                    FROM inserted i
+                    LEFT JOIN chat_summaries s ON s.chat_id = i.chat_id
+                    UNION ALL
+                    (
+                        -- Sees the snapshot from before the insert, so never the new row
+                        SELECT id, role, content, token_count, created_at, NULL, NULL, NULL
+                        FROM messages
+                        WHERE chat_id = %(chat_id)s AND EXISTS (SELECT 1 FROM chat)
+                        ORDER BY id DESC
+                        LIMIT %(limit)s
+                    )
+                """, {"chat_id": chat_id, "content": content, "token_count": token_count,
+                      "limit": context_limit - 1})
+                rows = cur.fetchall()
+                conn.commit()
+                if not rows:
+                    return None
+                recent = sorted((dict(row) for row in rows), key=lambda row: row["id"], reverse=True)
+                return {"message": recent[0], "recent": recent, "summary": split_summary(recent)}
+    
+    def finish_turn(self, chat_id: int, content: str, personality: str = None,
+                    color: str = None, token_count: int = None) -> Dict:
+        """Store an assistant reply and bump the chat's counters in one statement"""
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    WITH inserted AS (
+                        INSERT INTO messages (chat_id, role, content, personality, color, token_count)
+                        VALUES (%(chat_id)s, 'assistant', %(content)s, %(personality)s, %(color)s, %(token_count)s)
+                        RETURNING id, created_at
+                    ), chat AS (
+                        UPDATE chats
+                        SET updated_at = CURRENT_TIMESTAMP,
+                            message_count = message_count + 1,
+                            last_message_at = CURRENT_TIMESTAMP
+                        WHERE id = %(chat_id)s
+                    )
+                    SELECT id, created_at FROM inserted
+                """, {"chat_id": chat_id, "content": content, "personality": personality,
+                      "color": color, "token_count": token_count})
+                row = cur.fetchone()
+                conn.commit()
+                return dict(row)
+    
+    def delete_message(self, message_id: int):
+        """Delete a single message and update its chat's counters"""
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM messages WHERE id = %s RETURNING chat_id", (message_id,))
+                row = cur.fetchone()
+                if row:
+                    cur.execute("""
+                        UPDATE chats
+                        SET message_count = GREATEST(message_count - 1, 0),
+                            last_message_at = (
+                                SELECT MAX(created_at) FROM messages WHERE chat_id = %s
+                            )
+                        WHERE id = %s
+                    """, (row[0], row[0]))
+                conn.commit()
+    
     def delete_chat(self, chat_id: int):
         """Delete a chat and all its messages"""
         with self.get_connection() as conn:
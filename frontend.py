@@ -1,10 +1,11 @@
 import streamlit as st
 import requests
-<<<<<<< HEAD
 import json
 import uuid
 import time
 import base64
+import threading
+from collections import OrderedDict
 from typing import Dict, List
 
 # Configure Streamlit page
@@ -15,21 +16,83 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Static assets are read once per process, not on every rerun
+@st.cache_data
+def read_css(css_path: str) -> str:
+    with open(css_path, "r") as f:
+        return f.read()
+
 # Load custom CSS
 def load_css():
-    with open("static/cyberpunk.css", "r") as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+    st.markdown(f"<style>{read_css('static/cyberpunk.css')}</style>", unsafe_allow_html=True)
+
+@st.cache_data
+def encode_image(image_path: str) -> str:
+    with open(image_path, "rb") as img_file:
+        return base64.b64encode(img_file.read()).decode()
 
 # Convert image to base64
 def get_base64_image(image_path):
     """Convert image to base64 string"""
     try:
-        with open(image_path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode()
+        return encode_image(image_path)
     except Exception as e:
         st.error(f"Error loading image: {e}")
         return ""
 
+# Messages shown per window; "Load older" widens it
+MESSAGE_WINDOW = 50
+MAX_CACHED_FRAGMENTS = 5000
+
+@st.cache_resource
+def get_fragment_cache():
+    """Rendered message HTML keyed by message id, shared across reruns and sessions.
+
+    Sessions run in separate threads, so the dict is only touched under the lock.
+    """
+    return OrderedDict(), threading.Lock()
+
+def build_message_html(message: Dict) -> str:
+    if message["role"] == "user":
+        return f"""
+        <div class="user-message">
+            <div class="message-header">
+                <span class="user-icon">👤</span>
+                <span class="user-name">User</span>
+            </div>
+            <div class="message-content">{message["content"]}</div>
+        </div>
+        """
+    color = message.get("color") or "#00ff41"
+    personality = message.get("personality") or "AI"
+    return f"""
+        <div class="ai-message">
+            <div class="message-header">
+                <span class="ai-icon">🤖</span>
+                <span class="ai-name" style="color: {color}">{personality}</span>
+            </div>
+            <div class="message-content">{message["content"]}</div>
+        </div>
+        """
+
+def render_message_html(message: Dict) -> str:
+    """HTML for one message; stored messages never change, so it is built once per id"""
+    message_id = message.get("id")
+    if message_id is None:
+        return build_message_html(message)
+    cache, lock = get_fragment_cache()
+    with lock:
+        fragment = cache.get(message_id)
+        if fragment is not None:
+            cache.move_to_end(message_id)
+            return fragment
+    fragment = build_message_html(message)
+    with lock:
+        cache[message_id] = fragment
+        if len(cache) > MAX_CACHED_FRAGMENTS:
+            cache.popitem(last=False)
+    return fragment
+
 # Initialize session state
 def init_session_state():
     if "current_chat_id" not in st.session_state:
@@ -42,42 +105,89 @@ def init_session_state():
         st.session_state.personalities = {}
     if "chats" not in st.session_state:
         st.session_state.chats = []
+    if "chat_pages" not in st.session_state:
+        st.session_state.chat_pages = 1
+    if "more_chats" not in st.session_state:
+        st.session_state.more_chats = False
+    if "message_window" not in st.session_state:
+        st.session_state.message_window = MESSAGE_WINDOW
+    if "older_cursor" not in st.session_state:
+        st.session_state.older_cursor = None
 
 # API endpoints
 BACKEND_URL = "http://localhost:8000"
 
+# (connect, read) timeouts in seconds; the read timeout covers a full model reply
+REQUEST_TIMEOUT = (3.05, 60)
+
+# Backend reads cached across reruns; cleared explicitly when they change
+PERSONALITIES_TTL = 300
+CHATS_TTL = 30
+
+@st.cache_resource
+def get_http_session():
+    """Shared HTTP session, so requests reuse pooled keep-alive connections"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=10)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=PERSONALITIES_TTL, show_spinner=False)
+def fetch_personalities():
+    response = get_http_session().get(f"{BACKEND_URL}/personalities", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=CHATS_TTL, show_spinner=False)
+def fetch_chats(pages: int = 1):
+    """The first ``pages`` pages of chats, following the ``after`` cursor; returns (chats, has_more)"""
+    chats, cursor = [], None
+    for _ in range(pages):
+        params = {"after": cursor} if cursor else None
+        response = get_http_session().get(f"{BACKEND_URL}/chats", params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        page = response.json()
+        chats.extend(page["chats"])
+        cursor = page["after"]
+        if not page["has_more"]:
+            return chats, False
+    return chats, True
+
+def invalidate_chats():
+    """Drop the cached chat list after a chat is created, deleted or updated"""
+    fetch_chats.clear()
+
 def get_personalities():
     """Fetch available personalities from backend"""
     try:
-        response = requests.get(f"{BACKEND_URL}/personalities")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error("Failed to fetch personalities")
-            return {}
+        return fetch_personalities()
+    except requests.HTTPError:
+        st.error("Failed to fetch personalities")
+        return {}
     except Exception as e:
         st.error(f"Error connecting to backend: {e}")
         return {}
 
 def get_chats():
-    """Fetch all chats from backend"""
+    """Fetch the chats loaded so far from backend"""
     try:
-        response = requests.get(f"{BACKEND_URL}/chats")
-        if response.status_code == 200:
-            return response.json()["chats"]
-        else:
-            st.error("Failed to fetch chats")
-            return []
+        chats, st.session_state.more_chats = fetch_chats(st.session_state.chat_pages)
+        return chats
+    except requests.HTTPError:
+        st.error("Failed to fetch chats")
     except Exception as e:
         st.error(f"Error connecting to backend: {e}")
-        return []
+    st.session_state.more_chats = False
+    return []
 
 def create_chat(title: str):
     """Create a new chat"""
     try:
         payload = {"title": title}
-        response = requests.post(f"{BACKEND_URL}/chats", json=payload)
+        response = get_http_session().post(f"{BACKEND_URL}/chats", json=payload, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
+            invalidate_chats()
             return response.json()
         else:
             st.error(f"Error creating chat: {response.status_code} - {response.text}")
@@ -86,10 +196,41 @@ def create_chat(title: str):
         st.error(f"Error creating chat: {e}")
         return None
 
-def get_chat_messages(chat_id: int):
-    """Get messages for a specific chat"""
+def open_chat(chat_id: int):
+    """Load the newest page of a chat; older pages are fetched on demand"""
+    try:
+        response = get_http_session().get(f"{BACKEND_URL}/chats/{chat_id}", timeout=REQUEST_TIMEOUT)
+        if response.status_code == 200:
+            page = response.json()
+            st.session_state.current_chat_id = chat_id
+            st.session_state.messages = page["messages"]
+            st.session_state.older_cursor = page["before"] if page["has_more"] else None
+            st.session_state.message_window = MESSAGE_WINDOW
+        else:
+            st.error(f"Error fetching messages: {response.status_code} - {response.text}")
+    except Exception as e:
+        st.error(f"Error fetching messages: {e}")
+
+def load_older_messages(chat_id: int):
+    """Prepend the next older page of the current chat"""
+    try:
+        response = get_http_session().get(f"{BACKEND_URL}/chats/{chat_id}",
+                                          params={"before": st.session_state.older_cursor},
+                                          timeout=REQUEST_TIMEOUT)
+        if response.status_code == 200:
+            page = response.json()
+            st.session_state.messages = page["messages"] + st.session_state.messages
+            st.session_state.older_cursor = page["before"] if page["has_more"] else None
+        else:
+            st.error(f"Error fetching messages: {response.status_code} - {response.text}")
+    except Exception as e:
+        st.error(f"Error fetching messages: {e}")
+
+def get_chat_messages(chat_id: int, since: int = None):
+    """Get messages for a specific chat, or only those newer than message id ``since``"""
     try:
-        response = requests.get(f"{BACKEND_URL}/chats/{chat_id}")
+        params = {"since": since} if since is not None else None
+        response = get_http_session().get(f"{BACKEND_URL}/chats/{chat_id}", params=params, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             return response.json()["messages"]
         else:
@@ -99,6 +240,42 @@ def get_chat_messages(chat_id: int):
         st.error(f"Error fetching messages: {e}")
         return []
 
+def append_turn(user_input: str, response: Dict):
+    """Append a finished turn to the displayed messages without reloading the chat"""
+    # Replies shown before the server stored them are replaced by the stored rows
+    messages = [m for m in st.session_state.messages if m.get("id") is not None]
+    st.session_state.messages = messages
+    reply = {
+        "id": response["message_id"],
+        "role": "assistant",
+        "content": response["response"],
+        "personality": response["personality"],
+        "color": response["color"],
+        "created_at": response["created_at"]
+    }
+    if response.get("message_id") is None:
+        # The reply was queued server-side; fetch what has been stored since
+        last_id = max((m["id"] for m in messages), default=0)
+        messages.extend(get_chat_messages(response["chat_id"], since=last_id))
+        if not any(m["role"] == "assistant" and m["id"] > response["user_message_id"] for m in messages):
+            messages.append(reply)
+        return
+    messages.append({
+        "id": response["user_message_id"],
+        "role": "user",
+        "content": user_input,
+        "created_at": response["user_created_at"]
+    })
+    messages.append(reply)
+
+def show_chat_error(response):
+    """Report a failed chat request; overload rejections say when to retry"""
+    retry_after = response.headers.get("Retry-After")
+    if response.status_code in (429, 503) and retry_after:
+        st.warning(f"⏳ Skynet is at capacity. Your message was not sent; try again in {retry_after}s.")
+    else:
+        st.error(f"Error: {response.status_code} - {response.text}")
+
 def send_message(message: str, domain: str, chat_id: int):
     """Send message to backend"""
     try:
@@ -107,21 +284,81 @@ def send_message(message: str, domain: str, chat_id: int):
             "domain": domain,
             "chat_id": chat_id
         }
-        response = requests.post(f"{BACKEND_URL}/chat", json=payload)
+        response = get_http_session().post(f"{BACKEND_URL}/chat", json=payload, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
+            # The chat moved to the top of the list
+            invalidate_chats()
             return response.json()
         else:
-            st.error(f"Error: {response.status_code} - {response.text}")
+            show_chat_error(response)
             return None
     except Exception as e:
         st.error(f"Error sending message: {e}")
         return None
 
+class StreamingUnavailable(Exception):
+    """The backend has no streaming endpoint; use send_message instead"""
+
+def iter_sse(response):
+    """Yield (event, data) pairs from a Server-Sent Events response"""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+def stream_message(message: str, domain: str, chat_id: int, on_token):
+    """Send a message through /chat/stream, calling ``on_token`` with the reply so far.
+
+    Returns the final ``done`` payload (same fields as /chat), or None on error.
+    Raises StreamingUnavailable if the backend cannot stream.
+    """
+    payload = {
+        "message": message,
+        "domain": domain,
+        "chat_id": chat_id
+    }
+    try:
+        response = get_http_session().post(f"{BACKEND_URL}/chat/stream", json=payload,
+                                           stream=True, timeout=REQUEST_TIMEOUT)
+    except requests.ConnectionError:
+        raise StreamingUnavailable()
+    with response:
+        if response.status_code in (404, 405):
+            raise StreamingUnavailable()
+        if response.status_code != 200:
+            show_chat_error(response)
+            return None
+        parts = []
+        try:
+            for event, data in iter_sse(response):
+                if event == "token":
+                    parts.append(data["content"])
+                    on_token("".join(parts))
+                elif event == "done":
+                    # The chat moved to the top of the list
+                    invalidate_chats()
+                    return data
+                elif event == "error":
+                    st.error(f"Error: {data['detail']}")
+                    return None
+        except Exception as e:
+            st.error(f"Error receiving response: {e}")
+            return None
+    st.error("Error: the response stream ended early")
+    return None
+
 def delete_chat(chat_id: int):
     """Delete a chat"""
     try:
-        response = requests.delete(f"{BACKEND_URL}/chats/{chat_id}")
+        response = get_http_session().delete(f"{BACKEND_URL}/chats/{chat_id}", timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
+            invalidate_chats()
             st.success("Chat deleted")
             return True
         else:
@@ -173,11 +410,12 @@ def main():
             if new_chat:
                 st.session_state.current_chat_id = new_chat["id"]
                 st.session_state.messages = []
-                st.session_state.chats = get_chats()  # Refresh chats
+                st.session_state.older_cursor = None
+                st.session_state.message_window = MESSAGE_WINDOW
                 st.rerun()
         
 
-        # Load chats
+        # Load chats (cached; refetched after create, delete or send)
         st.session_state.chats = get_chats()
         
         # Display chat list
@@ -191,8 +429,7 @@ def main():
                         key=f"chat_{chat['id']}", 
                         use_container_width=True
                     ):
-                        st.session_state.current_chat_id = chat['id']
-                        st.session_state.messages = get_chat_messages(chat['id'])
+                        open_chat(chat['id'])
                         st.rerun()
                 with col2:
                     if st.button("🗑️", key=f"delete_{chat['id']}", help="Delete chat"):
@@ -200,8 +437,11 @@ def main():
                             if st.session_state.current_chat_id == chat['id']:
                                 st.session_state.current_chat_id = None
                                 st.session_state.messages = []
-                            st.session_state.chats = get_chats()  # Refresh chats
                             st.rerun()
+            if st.session_state.more_chats:
+                if st.button("⬇️ Load older chats", key="load_more_chats", use_container_width=True):
+                    st.session_state.chat_pages += 1
+                    st.rerun()
         else:
             st.markdown("*No chats yet. Create your first chat!*")
         
@@ -242,30 +482,24 @@ def main():
     if st.session_state.current_chat_id:
         st.markdown('<div class="chat-container">', unsafe_allow_html=True)
         
-        # Display chat messages
-        for message in st.session_state.messages:
-            if message["role"] == "user":
-                st.markdown(f"""
-                <div class="user-message">
-                    <div class="message-header">
-                        <span class="user-icon">👤</span>
-                        <span class="user-name">User</span>
-                    </div>
-                    <div class="message-content">{message["content"]}</div>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                color = message.get("color", "#00ff41")
-                personality = message.get("personality", "AI")
-                st.markdown(f"""
-                <div class="ai-message">
-                    <div class="message-header">
-                        <span class="ai-icon">🤖</span>
-                        <span class="ai-name" style="color: {color}">{personality}</span>
-                    </div>
-                    <div class="message-content">{message["content"]}</div>
-                </div>
-                """, unsafe_allow_html=True)
+        # Only the newest message_window messages are rendered
+        messages = st.session_state.messages
+        hidden = max(len(messages) - st.session_state.message_window, 0)
+        if hidden or st.session_state.older_cursor:
+            if st.button("⬆️ Load older messages", key="load_older", use_container_width=True):
+                if hidden < MESSAGE_WINDOW and st.session_state.older_cursor:
+                    load_older_messages(st.session_state.current_chat_id)
+                st.session_state.message_window += MESSAGE_WINDOW
+                st.rerun()
+        
+        # Display chat messages as one block of cached fragments
+        st.markdown(
+            "".join(render_message_html(message) for message in messages[hidden:]),
+            unsafe_allow_html=True
+        )
+        
+        # The reply being streamed is drawn here, below the conversation
+        live_turn = st.empty()
         
         st.markdown('</div>', unsafe_allow_html=True)
         
@@ -286,21 +520,42 @@ def main():
                 submit_button = st.form_submit_button("Send 🚀")
             
             if submit_button and user_input:
-                # Show loading indicator
-                with st.spinner("AI is thinking..."):
-                    # Send message to backend
-                    response = send_message(
+                personality_info = st.session_state.personalities.get(st.session_state.current_personality, {})
+                user_html = build_message_html({"role": "user", "content": user_input})
+                
+                def show_partial_reply(text):
+                    live_turn.markdown(user_html + build_message_html({
+                        "role": "assistant",
+                        "content": text,
+                        "personality": personality_info.get("name"),
+                        "color": personality_info.get("color")
+                    }), unsafe_allow_html=True)
+                
+                live_turn.markdown(user_html, unsafe_allow_html=True)
+                try:
+                    # Render tokens as they arrive
+                    response = stream_message(
                         user_input,
                         st.session_state.current_personality,
-                        st.session_state.current_chat_id
+                        st.session_state.current_chat_id,
+                        show_partial_reply
                     )
+                except StreamingUnavailable:
+                    # Show loading indicator
+                    with st.spinner("AI is thinking..."):
+                        # Send message to backend
+                        response = send_message(
+                            user_input,
+                            st.session_state.current_personality,
+                            st.session_state.current_chat_id
+                        )
+                
+                if response:
+                    # Add only the new messages to the conversation
+                    append_turn(user_input, response)
                     
-                    if response:
-                        # Reload messages from database to get the updated conversation
-                        st.session_state.messages = get_chat_messages(st.session_state.current_chat_id)
-                        
-                        # Rerun to update the chat display
-                        st.rerun()
+                    # Rerun to update the chat display
+                    st.rerun()
         
         st.markdown('</div>', unsafe_allow_html=True)
     else:
@@ -346,157 +601,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-=======
-import uuid
-import time
-
-st.set_page_config(page_title="SkyNetAI – Secure Conversational Intelligence", page_icon="🤖", layout="wide")
-
-# Custom CSS and fonts
-st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Orbitron:wght@700&family=Share+Tech+Mono&display=swap');
-    html, body, [class*="css"]  {
-        background-color: #0a0a0a !important;
-        color: #fff !important;
-        font-family: 'Share Tech Mono', 'Orbitron', monospace !important;
-    }
-    .skynet-title {
-        font-family: 'Orbitron', monospace;
-        color: #ff003c;
-        font-size: 2.5rem;
-        letter-spacing: 2px;
-        text-shadow: 0 0 10px #ff003c, 0 0 20px #ff003c;
-        border-bottom: 2px solid #ff003c;
-        padding-bottom: 0.5rem;
-        margin-bottom: 1.5rem;
-    }
-    .skynet-dropdown label, .skynet-dropdown select {
-        color: #ff003c !important;
-        font-family: 'Orbitron', monospace !important;
-        font-size: 1.1rem;
-    }
-    .skynet-chatbox {
-        background: #18181a;
-        border: 2px solid #ff003c;
-        border-radius: 10px;
-        padding: 1rem;
-        min-height: 400px;
-        max-height: 500px;
-        overflow-y: auto;
-        box-shadow: 0 0 20px #ff003c44;
-    }
-    .skynet-bubble-user {
-        background: #ff003c22;
-        color: #ff003c;
-        border-left: 4px solid #ff003c;
-        margin: 0.5rem 0;
-        padding: 0.5rem 1rem;
-        border-radius: 8px 8px 8px 2px;
-        font-family: 'Share Tech Mono', monospace;
-        text-shadow: 0 0 5px #ff003c88;
-    }
-    .skynet-bubble-ai {
-        background: #222226;
-        color: #fff;
-        border-left: 4px solid #ff003c;
-        margin: 0.5rem 0;
-        padding: 0.5rem 1rem;
-        border-radius: 8px 8px 2px 8px;
-        font-family: 'Share Tech Mono', monospace;
-        text-shadow: 0 0 5px #fff8;
-    }
-    .skynet-reset {
-        border: 2px solid #ff003c !important;
-        color: #ff003c !important;
-        background: #0a0a0a !important;
-        font-family: 'Orbitron', monospace !important;
-        font-size: 1.1rem !important;
-        border-radius: 8px !important;
-        box-shadow: 0 0 10px #ff003c44;
-        transition: box-shadow 0.2s;
-    }
-    .skynet-reset:hover {
-        box-shadow: 0 0 20px #ff003c;
-        background: #18181a !important;
-    }
-    .skynet-input input {
-        background: #18181a !important;
-        color: #ff003c !important;
-        border: 2px solid #ff003c !important;
-        font-family: 'Share Tech Mono', monospace !important;
-        font-size: 1.1rem !important;
-        border-radius: 8px !important;
-    }
-    </style>
-""", unsafe_allow_html=True)
-
-# Session state
-if "session_id" not in st.session_state:
-    st.session_state["session_id"] = str(uuid.uuid4())
-if "history" not in st.session_state:
-    st.session_state["history"] = []
-if "domain" not in st.session_state:
-    st.session_state["domain"] = "General"
-
-API_URL = "http://localhost:8000/chat"
-
-def render_chat():
-    st.markdown('<div class="skynet-chatbox">', unsafe_allow_html=True)
-    for msg in st.session_state["history"]:
-        if msg["role"] == "user":
-            st.markdown(f'<div class="skynet-bubble-user">{msg["content"]}</div>', unsafe_allow_html=True)
-        elif msg["role"] == "assistant":
-            st.markdown(f'<div class="skynet-bubble-ai">{msg["content"]}</div>', unsafe_allow_html=True)
-    st.markdown('</div>', unsafe_allow_html=True)
-
-def send_message(message):
-    data = {
-        "message": message,
-        "domain": st.session_state["domain"],
-        "session_id": st.session_state["session_id"]
-    }
-    try:
-        resp = requests.post(API_URL, json=data)
-        if resp.status_code == 200:
-            result = resp.json()
-            st.session_state["history"] = result["history"]
-            return result["reply"]
-        else:
-            return "[Error: Backend unavailable]"
-    except Exception as e:
-        return f"[Error: {e}]"
-
-# Title
-st.markdown('<div class="skynet-title">SkyNetAI – Secure Conversational Intelligence</div>', unsafe_allow_html=True)
-
-# Domain dropdown
-with st.container():
-    st.markdown('<div class="skynet-dropdown">', unsafe_allow_html=True)
-    domain = st.selectbox("Select Domain", ["General", "Finance", "Education", "Tech"], key="domain")
-    st.markdown('</div>', unsafe_allow_html=True)
-
-# Chat history
-render_chat()
-
-# User input
-with st.form(key="skynet-chat-form", clear_on_submit=True):
-    user_input = st.text_input("Type your message...", key="user_input", placeholder="Enter your message here", label_visibility="collapsed")
-    submitted = st.form_submit_button("Send", use_container_width=True)
-
-if submitted and user_input.strip():
-    with st.spinner("AI is thinking ..."):
-        # Animated loading dots
-        for i in range(3):
-            st.markdown(f'<span style="color:#ff003c;font-family:Orbitron;font-size:1.2rem;">AI is thinking{'.' * (i+1)}</span>', unsafe_allow_html=True)
-            time.sleep(0.3)
-        send_message(user_input)
-        st.rerun()
-
-# Reset button
-if st.button("Reset Chat", key="reset", help="Clear chat session", use_container_width=True):
-    send_message("__reset__")
-    st.session_state["history"] = []
-    st.session_state["session_id"] = str(uuid.uuid4())
-    st.rerun() 
->>>>>>> 40c0a3db4f3ad2d4297e7d1145c8ef533170b5c1
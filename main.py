@@ -1,38 +1,64 @@
-<<<<<<< HEAD
 #!/usr/bin/env python3
 """
 SkyNetAI - Cyberpunk AI Chatbot
 Main entry point for the application
 
 This script helps you start both the backend and frontend servers.
+Pass --production (or set BACKEND_ENV=production) to run the backend with
+multiple workers; see run_backend.py.
 """
 
 import subprocess
+import signal
 import sys
 import os
-import threading
 import time
+import urllib.request
 
-def run_backend():
-    """Run the backend server"""
+BACKEND_READY_URL = f"http://127.0.0.1:{os.getenv('BACKEND_PORT', '8000')}/ready"
+
+# Each server gets its own process group, so stop() reaches the processes
+# they start in turn (uvicorn workers, streamlit) and Ctrl+C is handled once,
+# here, instead of reaching every process at the same time
+def start_backend() -> subprocess.Popen:
+    """Start the backend server"""
     print("🚀 Starting Backend Server...")
-    try:
-        subprocess.run([sys.executable, "run_backend.py"], check=True)
-    except KeyboardInterrupt:
-        print("\n🛑 Backend server stopped")
-    except Exception as e:
-        print(f"❌ Backend error: {e}")
+    return subprocess.Popen([sys.executable, "run_backend.py"] + sys.argv[1:], start_new_session=True)
 
-def run_frontend():
-    """Run the frontend server"""
+def start_frontend() -> subprocess.Popen:
+    """Start the frontend server"""
     print("🎨 Starting Frontend Server...")
-    time.sleep(3)  # Wait for backend to start
+    return subprocess.Popen([sys.executable, "run_frontend.py"], start_new_session=True)
+
+def wait_for_backend(backend: subprocess.Popen, timeout: float = 30):
+    """Wait until the backend reports ready, or give up after ``timeout`` seconds"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and backend.poll() is None:
+        try:
+            with urllib.request.urlopen(BACKEND_READY_URL, timeout=1):
+                return
+        except Exception:
+            time.sleep(0.5)
+    print("⚠️  Backend is not ready yet; starting the frontend anyway")
+
+def stop(processes, timeout: float = 35):
+    """Send SIGTERM so each server drains in-flight requests, then kill stragglers"""
+    for process in processes:
+        signal_group(process, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        try:
+            process.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            pass
+        # Children of a server that has exited may still be running
+        signal_group(process, signal.SIGKILL if process.returncode is None else signal.SIGTERM)
+
+def signal_group(process: subprocess.Popen, sig: int):
     try:
-        subprocess.run([sys.executable, "run_frontend.py"], check=True)
-    except KeyboardInterrupt:
-        print("\n🛑 Frontend server stopped")
-    except Exception as e:
-        print(f"❌ Frontend error: {e}")
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
 
 def main():
     """Main entry point"""
@@ -61,68 +87,33 @@ def main():
     print("🚀 Starting SkyNetAI servers...")
     print("Press Ctrl+C to stop both servers")
     print()
-    
+
+    # Treat SIGTERM (e.g. from a process manager) like Ctrl+C, and handle
+    # Ctrl+C even when started with SIGINT ignored (e.g. as a background job)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    processes = []
     try:
-        # Start backend in a separate thread
-        backend_thread = threading.Thread(target=run_backend, daemon=True)
-        backend_thread.start()
-        
-        # Start frontend in main thread
-        run_frontend()
-        
+        processes.append(start_backend())
+        wait_for_backend(processes[0])
+        processes.append(start_frontend())
+
+        # Run until either server exits
+        while all(process.poll() is None for process in processes):
+            time.sleep(0.5)
+        print("❌ A server exited; stopping SkyNetAI...")
+        stop(processes)
+        sys.exit(1)
+
     except KeyboardInterrupt:
         print("\n🛑 Shutting down SkyNetAI...")
+        stop(processes)
         print("Goodbye from the Matrix!")
         sys.exit(0)
     except Exception as e:
         print(f"❌ Error: {e}")
+        stop(processes)
         sys.exit(1)
 
 if __name__ == "__main__":
     main()
-=======
-import os
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from dotenv import load_dotenv
-from chat_handler import get_openai_response
-from memory import get_history, add_message, reset_session
-
-load_dotenv()
-
-app = FastAPI()
-
-origins = [
-    "*"
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-class ChatRequest(BaseModel):
-    message: str
-    domain: str
-    session_id: str
-
-class ChatResponse(BaseModel):
-    reply: str
-    history: list
-
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest):
-    if req.message.lower() == "__reset__":
-        reset_session(req.session_id)
-        return {"reply": "Session reset.", "history": []}
-    history = get_history(req.session_id)
-    add_message(req.session_id, "user", req.message)
-    reply = get_openai_response(req.message, req.domain, req.session_id, history)
-    add_message(req.session_id, "assistant", reply)
-    updated_history = get_history(req.session_id)
-    return {"reply": reply, "history": updated_history} 
->>>>>>> 40c0a3db4f3ad2d4297e7d1145c8ef533170b5c1
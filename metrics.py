@@ -0,0 +1,231 @@
+import os
+import time
+import inspect
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Tuple
+
+# Minimal Prometheus text-format registry. Metrics are per process; with
+# several workers, scrape each one or put them behind a per-worker port.
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+                inf = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+HTTP_REQUEST_DURATION = Histogram(
+    "skynet_http_request_duration_seconds",
+    "Time from request start to the last response byte",
+    ("method", "endpoint", "status"),
+)
+STAGE_DURATION = Histogram(
+    "skynet_stage_duration_seconds",
+    "Time spent in one stage of a chat request",
+    ("stage", "endpoint", "personality"),
+)
+DB_CONNECT_DURATION = Histogram(
+    "skynet_db_connect_duration_seconds",
+    "Time to get a database connection: a pool checkout, including any wait or new connection, "
+    "or opening a thread's SQLite connection",
+)
+DB_QUERY_DURATION = Histogram(
+    "skynet_db_query_duration_seconds",
+    "Time spent in one storage operation",
+    ("operation",),
+)
+DB_QUERY_ERRORS = Counter(
+    "skynet_db_query_errors_total",
+    "Storage operations that raised",
+    ("operation",),
+)
+PROMPT_TOKENS = Histogram(
+    "skynet_prompt_tokens",
+    "Prompt tokens sent to the model per request",
+    ("endpoint", "personality"),
+    buckets=TOKEN_BUCKETS,
+)
+COMPLETION_TOKENS = Histogram(
+    "skynet_completion_tokens",
+    "Completion tokens returned by the model per request",
+    ("endpoint", "personality"),
+    buckets=TOKEN_BUCKETS,
+)
+ADMISSION_REJECTIONS = Counter(
+    "skynet_admission_rejections_total",
+    "Chat requests turned away by admission control",
+    ("reason",),
+)
+ADMISSION_WAIT = Histogram(
+    "skynet_admission_wait_seconds",
+    "Time queued chat requests waited for a model call slot",
+)
+
+REGISTRY = [HTTP_REQUEST_DURATION, STAGE_DURATION, DB_CONNECT_DURATION, DB_QUERY_DURATION,
+            DB_QUERY_ERRORS, PROMPT_TOKENS, COMPLETION_TOKENS, ADMISSION_REJECTIONS, ADMISSION_WAIT]
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def observe_stage(stage: str, seconds: float, endpoint: str = "", personality: str = ""):
+    if METRICS_ENABLED:
+        STAGE_DURATION.observe(seconds, stage=stage, endpoint=endpoint, personality=personality)
+
+@contextmanager
+def span(stage: str, endpoint: str = "", personality: str = ""):
+    """Record the duration of a block as one chat request stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started, endpoint, personality)
+
+def observe_tokens(endpoint: str, personality: str, prompt_tokens: int = None, completion_tokens: int = None):
+    if not METRICS_ENABLED:
+        return
+    if prompt_tokens is not None:
+        PROMPT_TOKENS.observe(prompt_tokens, endpoint=endpoint, personality=personality)
+    if completion_tokens is not None:
+        COMPLETION_TOKENS.observe(completion_tokens, endpoint=endpoint, personality=personality)
+
+def _timed(operation: str, method):
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            except Exception:
+                DB_QUERY_ERRORS.inc(operation=operation)
+                raise
+            finally:
+                DB_QUERY_DURATION.observe(time.perf_counter() - started, operation=operation)
+    else:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                DB_QUERY_ERRORS.inc(operation=operation)
+                raise
+            finally:
+                DB_QUERY_DURATION.observe(time.perf_counter() - started, operation=operation)
+    return wrapper
+
+def timed_queries(cls):
+    """Class decorator: record the duration of each public storage method.
+
+    Generators (streamed exports) and connection management are left alone.
+    """
+    if not METRICS_ENABLED:
+        return cls
+    skip = {"get_connection", "get_pool", "pool_stats", "close", "init_database", "transaction"}
+    for name, method in list(vars(cls).items()):
+        if (name.startswith("_") or name in skip or not inspect.isfunction(method)
+                or inspect.isgeneratorfunction(method) or inspect.isasyncgenfunction(method)):
+            continue
+        setattr(cls, name, _timed(name, method))
+    return cls
+
+class MetricsMiddleware:
+    """ASGI middleware recording request duration by route template and status.
+
+    Timing stops after the last body chunk, so streamed responses are
+    measured end to end.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Unmatched paths share one label so scans cannot blow up cardinality
+            endpoint = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method=scope["method"],
+                                          endpoint=endpoint, status=str(status["code"]))
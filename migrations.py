@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+SkyNetAI schema migrations
+
+Each migration runs once; applied versions are recorded in the
+schema_migrations table. Index migrations use CREATE INDEX CONCURRENTLY so
+they do not block writes on live tables, which means they run outside a
+transaction and hold one statement each.
+
+Usage:
+    python migrations.py           # apply pending migrations
+    python migrations.py status    # list applied and pending migrations
+"""
+
+import os
+import sys
+from typing import List, Set
+
+# Arbitrary key for pg_advisory_lock so concurrent deploys migrate one at a time
+MIGRATION_LOCK_ID = 7_250_401
+
+MIGRATIONS = [
+    {
+        "version": 1,
+        "name": "initial schema",
+        "concurrent": False,
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS chats (
+                id SERIAL PRIMARY KEY,
+                title VARCHAR(255) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id SERIAL PRIMARY KEY,
+                chat_id INTEGER REFERENCES chats(id) ON DELETE CASCADE,
+                role VARCHAR(50) NOT NULL,
+                content TEXT NOT NULL,
+                personality VARCHAR(100),
+                color VARCHAR(20),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """,
+            # Cached prompt token count per message
+            """
+            ALTER TABLE messages
+            ADD COLUMN IF NOT EXISTS token_count INTEGER;
+            """,
+            # Per-chat counters maintained on write
+            """
+            ALTER TABLE chats
+            ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP;
+            """,
+            """
+            UPDATE chats c
+            SET message_count = m.message_count,
+                last_message_at = m.last_message_at
+            FROM (
+                SELECT chat_id, COUNT(*) as message_count, MAX(created_at) as last_message_at
+                FROM messages
+                GROUP BY chat_id
+            ) m
+            WHERE m.chat_id = c.id;
+            """,
+        ],
+    },
+    {
+        "version": 2,
+        "name": "messages (chat_id, created_at) index",
+        "concurrent": True,
+        "index": "idx_messages_chat_id_created_at",
+        "statements": [
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_chat_id_created_at
+            ON messages(chat_id, created_at);
+            """,
+        ],
+    },
+    {
+        "version": 3,
+        "name": "messages (chat_id, id) index",
+        "concurrent": True,
+        "index": "idx_messages_chat_id_id",
+        "statements": [
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_chat_id_id
+            ON messages(chat_id, id);
+            """,
+        ],
+    },
+    {
+        "version": 4,
+        "name": "chats updated_at covering index",
+        "concurrent": True,
+        "index": "idx_chats_updated_at",
+        "statements": [
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chats_updated_at
+            ON chats(updated_at DESC, id DESC)
+            INCLUDE (title, created_at, message_count, last_message_at);
+            """,
+        ],
+    },
+    {
+        # Both composite indexes start with chat_id, so they also serve the
+        # foreign key lookups this index existed for
+        "version": 5,
+        "name": "drop redundant messages chat_id index",
+        "concurrent": True,
+        "statements": [
+            "DROP INDEX CONCURRENTLY IF EXISTS idx_messages_chat_id;",
+        ],
+    },
+    {
+        # A trigger keeps the column current; adding it nullable is instant
+        # and leaves existing rows to the backfill below
+        "version": 6,
+        "name": "messages search_vector column",
+        "concurrent": False,
+        "statements": [
+            """
+            ALTER TABLE messages
+            ADD COLUMN IF NOT EXISTS search_vector tsvector;
+            """,
+            """
+            CREATE OR REPLACE FUNCTION messages_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := to_tsvector('english', NEW.content);
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+            """,
+            "DROP TRIGGER IF EXISTS messages_search_vector_update ON messages;",
+            """
+            CREATE TRIGGER messages_search_vector_update
+            BEFORE INSERT OR UPDATE OF content ON messages
+            FOR EACH ROW EXECUTE FUNCTION messages_search_vector_update();
+            """,
+        ],
+    },
+    {
+        # Commits every 10000 ids so the backfill never holds long row locks;
+        # rerunning after an interruption only touches rows still missing
+        "version": 7,
+        "name": "backfill messages search_vector",
+        "concurrent": True,
+        "statements": [
+            """
+            DO $$
+            DECLARE
+                last_id INTEGER := 0;
+                max_id INTEGER;
+            BEGIN
+                SELECT COALESCE(MAX(id), 0) INTO max_id FROM messages;
+                WHILE last_id < max_id LOOP
+                    UPDATE messages
+                    SET search_vector = to_tsvector('english', content)
+                    WHERE id > last_id AND id <= last_id + 10000 AND search_vector IS NULL;
+                    last_id := last_id + 10000;
+                    COMMIT;
+                END LOOP;
+            END
+            $$;
+            """,
+        ],
+    },
+    {
+        "version": 8,
+        "name": "messages search_vector GIN index",
+        "concurrent": True,
+        "index": "idx_messages_search_vector",
+        "statements": [
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_search_vector
+            ON messages USING GIN (search_vector);
+            """,
+        ],
+    },
+    {
+        "version": 9,
+        "name": "chat summaries",
+        "concurrent": False,
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS chat_summaries (
+                chat_id INTEGER PRIMARY KEY REFERENCES chats(id) ON DELETE CASCADE,
+                content TEXT NOT NULL,
+                covered_message_id INTEGER NOT NULL,
+                token_count INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """,
+        ],
+    },
+]
+
+LATEST_VERSION = max(m["version"] for m in MIGRATIONS)
+
+def get_connection_string() -> str:
+    connection_string = os.environ.get("DATABASE_URL")
+    if connection_string and connection_string.startswith("postgres://"):
+        connection_string = connection_string.replace("postgres://", "postgresql://", 1)
+    return connection_string
+
+def pending_versions(applied: Set[int]) -> List[int]:
+    """Versions of migrations not yet in ``applied``"""
+    return [m["version"] for m in MIGRATIONS if m["version"] not in applied]
+
+def get_applied_versions(cur) -> Set[int]:
+    """Read applied versions; empty if the tracking table does not exist yet"""
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return set()
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+def _drop_invalid_index(cur, name: str):
+    """Drop an index left INVALID by an interrupted CREATE INDEX CONCURRENTLY"""
+    cur.execute("""
+        SELECT NOT indisvalid FROM pg_index
+        WHERE indexrelid = to_regclass(%s)
+    """, (name,))
+    row = cur.fetchone()
+    if row and row[0]:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+def migrate(connection_string: str = None) -> List[int]:
+    """Apply pending migrations in order and return the versions applied"""
+    import psycopg2
+    conn = psycopg2.connect(connection_string or get_connection_string())
+    conn.autocommit = True
+    applied_now = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            try:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                """)
+                applied = get_applied_versions(cur)
+                for migration in MIGRATIONS:
+                    if migration["version"] in applied:
+                        continue
+                    print(f"Applying migration {migration['version']}: {migration['name']}")
+                    if migration["concurrent"]:
+                        # CONCURRENTLY cannot run inside a transaction block
+                        if migration.get("index"):
+                            _drop_invalid_index(cur, migration["index"])
+                        for statement in migration["statements"]:
+                            cur.execute(statement)
+                        cur.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                            (migration["version"], migration["name"]),
+                        )
+                    else:
+                        cur.execute("BEGIN")
+                        try:
+                            for statement in migration["statements"]:
+                                cur.execute(statement)
+                            cur.execute(
+                                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                (migration["version"], migration["name"]),
+                            )
+                            cur.execute("COMMIT")
+                        except Exception:
+                            cur.execute("ROLLBACK")
+                            raise
+                    applied_now.append(migration["version"])
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    finally:
+        conn.close()
+    return applied_now
+
+def status(connection_string: str = None):
+    """Print applied and pending migrations"""
+    import psycopg2
+    conn = psycopg2.connect(connection_string or get_connection_string())
+    try:
+        with conn.cursor() as cur:
+            applied = get_applied_versions(cur)
+    finally:
+        conn.close()
+    for migration in MIGRATIONS:
+        state = "applied" if migration["version"] in applied else "pending"
+        print(f"{migration['version']:>4}  {state:<8} {migration['name']}")
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    if command == "status":
+        status()
+    elif command == "migrate":
+        applied = migrate()
+        if applied:
+            print(f"✅ Applied migrations: {', '.join(str(v) for v in applied)}")
+        else:
+            print("✅ Database schema is up to date")
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import base64
+from datetime import datetime
+from typing import Tuple
+
+# Keyset cursors are opaque to clients: base64url of the sort key of the
+# row the page starts or ends at.
+
+def _encode(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+def encode_chat_cursor(updated_at: datetime, chat_id: int) -> str:
+    """Cursor for a chat in the (updated_at DESC, id DESC) listing"""
+    return _encode(f"{updated_at.isoformat()}|{chat_id}")
+
+def decode_chat_cursor(cursor: str) -> Tuple[datetime, int]:
+    raw = _decode(cursor)
+    try:
+        updated_at, chat_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(updated_at), int(chat_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+def encode_search_cursor(rank: float, message_id: int) -> str:
+    """Cursor for a search hit in the (rank DESC, id DESC) listing"""
+    return _encode(f"{rank!r}|{message_id}")
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    raw = _decode(cursor)
+    try:
+        rank, message_id = raw.split("|", 1)
+        return float(rank), int(message_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+def encode_message_cursor(message_id: int) -> str:
+    """Cursor for a message in a chat's (id ASC) listing"""
+    return _encode(str(message_id))
+
+def decode_message_cursor(cursor: str) -> int:
+    raw = _decode(cursor)
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
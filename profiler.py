@@ -0,0 +1,206 @@
+import os
+import hmac
+import sys
+import time
+import uuid
+import random
+import asyncio
+import threading
+import contextvars
+import weakref
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Opt-in request profiler. Disabled unless PROFILER_ADMIN_TOKEN is set; then a
+# request is profiled when it sends "X-Profile: 1" with a matching
+# "X-Profile-Token" header, or at random with probability PROFILER_SAMPLE_RATE.
+#
+# While a profiled request runs, a sampler thread records every
+# PROFILER_INTERVAL seconds:
+#   wall - the stacks of the request's own tasks, suspended or not, so time
+#          spent awaiting the database or the model shows up
+#   cpu  - the stack the event loop thread is executing, skipping idle
+#          samples; this includes any concurrent requests sharing the loop
+# Profiles are kept in a ring buffer of PROFILER_MAX_PROFILES and served as
+# collapsed stacks ("frame;frame;frame count"), which flamegraph.pl,
+# speedscope and inferno read directly.
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _collapse(frames) -> str:
+    return ";".join(_frame_label(frame.f_code) for frame in frames)
+
+def _coroutine_stack(coro) -> List:
+    """Frames of a task's await chain, outermost first"""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        stack.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return stack
+
+def _thread_stack(frame) -> List:
+    stack = []
+    while frame is not None:
+        stack.append(frame)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, interval: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.status = None
+        self.started_at = datetime.now()
+        self.duration = None
+        self._started = None
+        self.wall = Counter()
+        self.cpu = Counter()
+        self.tasks = weakref.WeakSet()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, loop_thread_id: int):
+        self.tasks.add(asyncio.current_task())
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, args=(loop_thread_id,),
+                                        name=f"profiler-{self.id}", daemon=True)
+        self._thread.start()
+
+    async def stop(self, status: Optional[int]):
+        """Stop sampling; the sampler thread is joined off the event loop"""
+        self._stop.set()
+        self.duration = time.perf_counter() - self._started
+        self.status = status
+        await asyncio.to_thread(self._thread.join)
+
+    def _sample(self, loop_thread_id: int):
+        while not self._stop.wait(self.interval):
+            for task in list(self.tasks):
+                if task.done():
+                    continue
+                try:
+                    # Tasks can change under us; a torn sample is just skipped
+                    stack = _coroutine_stack(task.get_coro())
+                except Exception:
+                    continue
+                if stack:
+                    self.wall[_collapse(stack)] += 1
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is not None and not frame.f_code.co_filename.endswith("selectors.py"):
+                self.cpu[_collapse(_thread_stack(frame))] += 1
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "interval_ms": self.interval * 1000,
+            "wall_samples": sum(self.wall.values()),
+            "cpu_samples": sum(self.cpu.values()),
+        }
+
+    def collapsed(self, kind: str) -> str:
+        samples = self.wall if kind == "wall" else self.cpu
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+class Profiler:
+    def __init__(self, admin_token: Optional[str], sample_rate: float = 0.0,
+                 interval: float = 0.005, max_profiles: int = 20):
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.profiles = deque(maxlen=max_profiles)
+        self._factory_loops = weakref.WeakSet()
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        return cls(
+            os.environ.get("PROFILER_ADMIN_TOKEN") or None,
+            sample_rate=float(os.environ.get("PROFILER_SAMPLE_RATE", "0")),
+            interval=float(os.environ.get("PROFILER_INTERVAL", "0.005")),
+            max_profiles=int(os.environ.get("PROFILER_MAX_PROFILES", "20")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.admin_token is not None
+
+    def is_authorized(self, token: Optional[str]) -> bool:
+        return self.enabled and token is not None and hmac.compare_digest(token.encode(), self.admin_token.encode())
+
+    def should_profile(self, headers: Dict[bytes, bytes]) -> bool:
+        if headers.get(b"x-profile") == b"1":
+            token = headers.get(b"x-profile-token")
+            return self.is_authorized(token.decode("latin-1") if token else None)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        for profile in self.profiles:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def _install_task_factory(self, loop):
+        # Tasks spawned while serving a profiled request (e.g. the body of a
+        # StreamingResponse) are sampled along with the request's own task
+        if loop in self._factory_loops or loop.get_task_factory() is not None:
+            return
+
+        def task_factory(loop, coro, **kwargs):
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+            context = kwargs.get("context")
+            profile = context.get(_current_profile) if context is not None else _current_profile.get()
+            if profile is not None:
+                profile.tasks.add(task)
+            return task
+
+        loop.set_task_factory(task_factory)
+        self._factory_loops.add(loop)
+
+class ProfilerMiddleware:
+    """ASGI middleware that profiles opted-in requests; a no-op while disabled"""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+        if not self.profiler.should_profile(dict(scope["headers"])):
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        self.profiler._install_task_factory(loop)
+        profile = RequestProfile(scope["method"], scope["path"], self.profiler.interval)
+        status = {"code": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        profile.start(threading.get_ident())
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            await profile.stop(status["code"])
+            self.profiler.profiles.append(profile)
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+class ResponseCache:
+    """Exact-match cache of model completions.
+
+    Keys hash the model, the sampling parameters and the full prompt
+    (system prompt plus context messages), so a hit is only possible when
+    the model would see exactly the same input. Entries expire after ``ttl``
+    seconds and the least recently used ones are evicted once the cached
+    responses exceed ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600.0,
+                 max_temperature: float = 1.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self._entries = OrderedDict()  # key -> (expires_at, response, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypasses": 0, "evictions": 0, "expirations": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Build the cache from RESPONSE_CACHE_* settings; None when disabled"""
+        if os.environ.get("RESPONSE_CACHE_ENABLED", "0") != "1":
+            return None
+        return cls(
+            max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "3600")),
+            max_temperature=float(os.environ.get("RESPONSE_CACHE_MAX_TEMPERATURE", "1.0")),
+        )
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict], **params) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "params": params},
+                             sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def should_bypass(self, temperature: float, fresh: bool = False) -> bool:
+        """Skip the cache for fresh-answer requests and high-temperature sampling"""
+        if fresh or temperature > self.max_temperature:
+            with self._lock:
+                self._stats["bypasses"] += 1
+            return True
+        return False
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, response, size = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return response
+
+    def set(self, key: str, response: str):
+        size = len(key) + len(response.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (time.monotonic() + self.ttl, response, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats.update({
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            })
+            return stats
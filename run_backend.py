@@ -2,8 +2,23 @@
 """
 SkyNetAI Backend Runner
 Starts the FastAPI backend server on port 8000
+
+Usage:
+    python run_backend.py                 # development: one process, auto-reload
+    python run_backend.py --production    # production: multiple workers, no reload
+
+Production mode (also selected by BACKEND_ENV=production) is configured with:
+    WEB_CONCURRENCY           worker processes (default: CPU core count)
+    HOST / BACKEND_PORT       bind address (default: 0.0.0.0:8000)
+    GRACEFUL_SHUTDOWN_TIMEOUT seconds to drain in-flight requests on SIGTERM (default: 30)
+    DB_MAX_CONNECTIONS        database connections for the whole node, split
+                              across workers unless DB_POOL_MAX_SIZE is set
+
+WRITE_BEHIND_ENABLED=1 requires WEB_CONCURRENCY=1: each worker has its own
+queue, so a chat's messages could be stored out of order across workers.
 """
 
+import importlib.util
 import uvicorn
 import os
 import sys
@@ -11,26 +26,95 @@ import sys
 # Add current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+def is_production() -> bool:
+    return "--production" in sys.argv[1:] or os.getenv("BACKEND_ENV", "").lower() == "production"
+
+def get_worker_count() -> int:
+    return int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+
+def size_worker_pools(workers: int):
+    """Split DB_MAX_CONNECTIONS across workers; workers inherit the environment"""
+    if os.getenv("DB_POOL_MAX_SIZE"):
+        return
+    total = os.getenv("DB_MAX_CONNECTIONS")
+    if total:
+        per_worker = max(int(total) // workers, 1)
+        os.environ["DB_POOL_MAX_SIZE"] = str(per_worker)
+        os.environ["DB_POOL_MIN_SIZE"] = str(min(int(os.getenv("DB_POOL_MIN_SIZE", "1")), per_worker))
+        print(f"🗄️  Database pool: {per_worker} connections per worker ({total} total)")
+    else:
+        print(f"🗄️  Database pool: up to 10 connections per worker ({10 * workers} total); "
+              f"set DB_MAX_CONNECTIONS to cap the node")
+
+def check_write_behind(workers: int):
+    """Refuse write-behind with several workers: per-process queues cannot keep a chat's messages in order"""
+    if workers > 1 and os.getenv("WRITE_BEHIND_ENABLED", "0") == "1":
+        print(f"❌ WRITE_BEHIND_ENABLED=1 needs a single worker, got {workers}; "
+              f"set WEB_CONCURRENCY=1 or WRITE_BEHIND_ENABLED=0")
+        sys.exit(1)
+
+def fastest_available(module: str, fallback: str) -> str:
+    return module if importlib.util.find_spec(module) is not None else fallback
+
+def run_migrations():
+    """Apply pending schema migrations once, before any worker starts"""
+    if os.getenv("DATABASE_URL", "").startswith(("postgres://", "postgresql://")):
+        try:
+            from migrations import migrate
+            applied = migrate()
+            if applied:
+                print(f"🗄️  Applied database migrations: {', '.join(str(v) for v in applied)}")
+        except Exception as e:
+            print(f"⚠️  WARNING: Database migrations failed: {e}")
+
 def main():
     """Run the FastAPI backend server"""
+    production = is_production()
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("BACKEND_PORT", "8000"))
+
     print("🚀 Starting SkyNetAI Backend Server...")
-    print("📡 Backend will be available at: http://localhost:8000")
-    print("🤖 API Documentation: http://localhost:8000/docs")
+    print(f"📡 Backend will be available at: http://localhost:{port}")
+    print(f"🤖 API Documentation: http://localhost:{port}/docs")
     print("⚡ Make sure your OPENAI_API_KEY environment variable is set!")
-    
+
     # Check if OpenAI API key is set
     if not os.getenv("OPENAI_API_KEY"):
         print("⚠️  WARNING: OPENAI_API_KEY environment variable not found!")
         print("   Please set it with: export OPENAI_API_KEY=your_api_key_here")
-    
+
+    run_migrations()
+
     try:
-        uvicorn.run(
-            "backend:app",
-            host="0.0.0.0",
-            port=8000,
-            reload=True,
-            log_level="info"
-        )
+        if production:
+            workers = get_worker_count()
+            check_write_behind(workers)
+            size_worker_pools(workers)
+            loop = fastest_available("uvloop", "asyncio")
+            http = fastest_available("httptools", "h11")
+            print(f"🏭 Production mode: {workers} workers, loop={loop}, http={http}")
+            # uvicorn's supervisor forwards SIGTERM to the workers, which stop
+            # accepting connections and finish in-flight requests first
+            uvicorn.run(
+                "backend:app",
+                host=host,
+                port=port,
+                workers=workers,
+                loop=loop,
+                http=http,
+                proxy_headers=True,
+                timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+                access_log=os.getenv("ACCESS_LOG", "0") == "1",
+                log_level="info"
+            )
+        else:
+            uvicorn.run(
+                "backend:app",
+                host=host,
+                port=port,
+                reload=True,
+                log_level="info"
+            )
     except KeyboardInterrupt:
         print("\n🛑 SkyNetAI Backend Server stopped")
     except Exception as e:
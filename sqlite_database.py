@@ -0,0 +1,498 @@
+import re
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Dict, Optional, Tuple
+from storage import StorageBackend
+from metrics import DB_CONNECT_DURATION, METRICS_ENABLED, timed_queries
+
+# Timestamps are stored as 'YYYY-MM-DD HH:MM:SS.SSS' text so that string
+# comparison matches time order; bound datetimes use the same format.
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+def _adapt_datetime(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S.") + f"{value.microsecond // 1000:03d}"
+
+def _convert_timestamp(value: bytes) -> datetime:
+    return datetime.fromisoformat(value.decode())
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+
+SCHEMA_VERSION = 3
+
+SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS chats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT ({NOW}),
+        updated_at TIMESTAMP DEFAULT ({NOW}),
+        message_count INTEGER NOT NULL DEFAULT 0,
+        last_message_at TIMESTAMP
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER REFERENCES chats(id) ON DELETE CASCADE,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        personality TEXT,
+        color TEXT,
+        created_at TIMESTAMP DEFAULT ({NOW}),
+        token_count INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_messages_chat_id_id ON messages(chat_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_chat_id_created_at ON messages(chat_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_chats_updated_at ON chats(updated_at DESC, id DESC)",
+    # Full-text index over message content, kept in sync by triggers
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+    USING fts5(content, content='messages', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    f"""
+    CREATE TABLE IF NOT EXISTS chat_summaries (
+        chat_id INTEGER PRIMARY KEY REFERENCES chats(id) ON DELETE CASCADE,
+        content TEXT NOT NULL,
+        covered_message_id INTEGER NOT NULL,
+        token_count INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT ({NOW})
+    )
+    """,
+]
+
+def _fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query matching every word"""
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+
+@timed_queries
+class SQLiteDatabaseManager(StorageBackend):
+    """Embedded storage backend on a local SQLite file.
+
+    Each thread gets its own connection, opened in WAL mode so readers do
+    not block the single writer. Queries are parameterized with fixed SQL
+    text, which lets sqlite3's statement cache reuse the prepared statements.
+    """
+
+    def __init__(self, path: str = "skynet.db"):
+        self.path = path
+        if path == ":memory:":
+            # Per-thread connections must share one in-memory database
+            self._target, self._uri = "file:skynet?mode=memory&cache=shared", True
+        else:
+            self._target, self._uri = path, False
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        # The file is opened and the schema checked by the first query, once
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        started = time.perf_counter()
+        conn = sqlite3.connect(
+            self._target,
+            uri=self._uri,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+        with self._lock:
+            self._connections.append(conn)
+        if METRICS_ENABLED:
+            DB_CONNECT_DURATION.observe(time.perf_counter() - started)
+        return conn
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            if not self._schema_ready:
+                with self._schema_lock:
+                    if not self._schema_ready:
+                        try:
+                            self.init_database()
+                        except Exception:
+                            # Retry on this thread's next query
+                            self._local.conn = None
+                            raise
+                        self._schema_ready = True
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a block in a write transaction on this thread's connection"""
+        conn = self.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def init_database(self):
+        """Create the schema if this file does not have it yet"""
+        conn = self.get_connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        with self.transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def ping(self):
+        """Run a trivial query; raises if the database is unreachable"""
+        self.get_connection().execute("SELECT 1").fetchone()
+
+    def pool_stats(self) -> Dict:
+        """Get connection statistics"""
+        with self._lock:
+            return {"backend": "sqlite", "path": self.path, "connections": len(self._connections)}
+
+    def close(self):
+        """Close every thread's connection"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    def create_chat(self, title: str) -> int:
+        """Create a new chat session"""
+        with self.transaction() as conn:
+            return conn.execute("INSERT INTO chats (title) VALUES (?) RETURNING id", (title,)).fetchone()[0]
+
+    def get_all_chats(self) -> List[Dict]:
+        """Get all chat sessions"""
+        rows = self.get_connection().execute("""
+            SELECT id, title, created_at, updated_at, message_count, last_message_at
+            FROM chats
+            ORDER BY updated_at DESC, id DESC
+        """).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_chats_page(self, limit: int, before: Tuple[datetime, int] = None,
+                       after: Tuple[datetime, int] = None) -> Tuple[List[Dict], bool]:
+        """Get one page of chats ordered by (updated_at, id) descending"""
+        conn = self.get_connection()
+        if before is not None:
+            rows = conn.execute("""
+                SELECT id, title, created_at, updated_at, message_count, last_message_at
+                FROM chats
+                WHERE (updated_at, id) > (?, ?)
+                ORDER BY updated_at ASC, id ASC
+                LIMIT ?
+            """, (before[0], before[1], limit + 1)).fetchall()
+            page = [dict(row) for row in rows[:limit]]
+            page.reverse()
+        else:
+            updated_at, chat_id = after if after is not None else (None, None)
+            rows = conn.execute("""
+                SELECT id, title, created_at, updated_at, message_count, last_message_at
+                FROM chats
+                WHERE ? IS NULL OR (updated_at, id) < (?, ?)
+                ORDER BY updated_at DESC, id DESC
+                LIMIT ?
+            """, (updated_at, updated_at, chat_id, limit + 1)).fetchall()
+            page = [dict(row) for row in rows[:limit]]
+        return page, len(rows) > limit
+
+    def get_chat_messages(self, chat_id: int) -> List[Dict]:
+        """Get all messages for a specific chat"""
+        rows = self.get_connection().execute("""
+            SELECT role, content, personality, color, created_at
+            FROM messages
+            WHERE chat_id = ?
+            ORDER BY created_at ASC, id ASC
+        """, (chat_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_messages_page(self, chat_id: int, limit: int, before: int = None,
+                          after: int = None) -> Tuple[List[Dict], bool]:
+        """Get one page of a chat's messages in chronological order"""
+        conn = self.get_connection()
+        if after is not None:
+            rows = conn.execute("""
+                SELECT id, role, content, personality, color, created_at
+                FROM messages
+                WHERE chat_id = ? AND id > ?
+                ORDER BY id ASC
+                LIMIT ?
+            """, (chat_id, after, limit + 1)).fetchall()
+            page = [dict(row) for row in rows[:limit]]
+        else:
+            rows = conn.execute("""
+                SELECT id, role, content, personality, color, created_at
+                FROM messages
+                WHERE chat_id = ? AND (? IS NULL OR id < ?)
+                ORDER BY id DESC
+                LIMIT ?
+            """, (chat_id, before, before, limit + 1)).fetchall()
+            page = [dict(row) for row in rows[:limit]]
+            page.reverse()
+        return page, len(rows) > limit
+
+    def get_recent_messages(self, chat_id: int, limit: int, before: int = None) -> List[Dict]:
+        """Get up to ``limit`` messages of a chat, newest first, older than message id ``before``"""
+        rows = self.get_connection().execute("""
+            SELECT id, role, content, token_count
+            FROM messages
+            WHERE chat_id = ? AND (? IS NULL OR id < ?)
+            ORDER BY id DESC
+            LIMIT ?
+        """, (chat_id, before, before, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def search_messages(self, query: str, limit: int, chat_id: int = None, role: str = None,
+                        personality: str = None, after: Tuple[float, int] = None) -> Tuple[List[Dict], bool]:
+        """Full-text search over messages, best matches first"""
+        match = _fts_query(query)
+        if not match:
+            return [], False
+        after_rank, after_id = after if after is not None else (None, None)
+        rows = self.get_connection().execute("""
+            WITH hits AS (
+                SELECT rowid AS id, -bm25(messages_fts) AS rank,
+                       snippet(messages_fts, 0, '<mark>', '</mark>', '…', 24) AS snippet
+                FROM messages_fts
+                WHERE messages_fts MATCH ?
+            )
+            SELECT m.id, m.chat_id, c.title AS chat_title, m.role, m.personality, m.color,
+                   m.created_at, hits.rank, hits.snippet
+            FROM hits
+            JOIN messages m ON m.id = hits.id
+            JOIN chats c ON c.id = m.chat_id
+            WHERE (? IS NULL OR m.chat_id = ?)
+              AND (? IS NULL OR m.role = ?)
+              AND (? IS NULL OR m.personality = ?)
+              AND (? IS NULL OR (hits.rank, m.id) < (?, ?))
+            ORDER BY hits.rank DESC, m.id DESC
+            LIMIT ?
+        """, (match, chat_id, chat_id, role, role, personality, personality,
+              after_rank, after_rank, after_id, limit + 1)).fetchall()
+        return [dict(row) for row in rows[:limit]], len(rows) > limit
+
+    def get_chat_summary(self, chat_id: int) -> Optional[Dict]:
+        """Get a chat's stored summary and the last message id it covers"""
+        row = self.get_connection().execute("""
+            SELECT content, covered_message_id, token_count, updated_at
+            FROM chat_summaries
+            WHERE chat_id = ?
+        """, (chat_id,)).fetchone()
+        return dict(row) if row else None
+
+    def save_chat_summary(self, chat_id: int, content: str, covered_message_id: int, token_count: int):
+        """Store a chat's summary unless a newer one is already stored"""
+        with self.transaction() as conn:
+            conn.execute(f"""
+                INSERT INTO chat_summaries (chat_id, content, covered_message_id, token_count)
+                SELECT id, ?, ?, ? FROM chats WHERE id = ?
+                ON CONFLICT (chat_id) DO UPDATE
+                SET content = excluded.content,
+                    covered_message_id = excluded.covered_message_id,
+                    token_count = excluded.token_count,
+                    updated_at = {NOW}
+                WHERE chat_summaries.covered_message_id < excluded.covered_message_id
+            """, (content, covered_message_id, token_count, chat_id))
+
+    def set_token_counts(self, counts: List[tuple]):
+        """Store token counts given as (message_id, token_count) pairs"""
+        with self.transaction() as conn:
+            conn.executemany("UPDATE messages SET token_count = ? WHERE id = ?",
+                             [(token_count, message_id) for message_id, token_count in counts])
+
+    def _insert_message(self, conn, chat_id: int, role: str, content: str, personality: str = None,
+                        color: str = None, token_count: int = None) -> Optional[sqlite3.Row]:
+        """Insert a message and bump the chat's counters; None if the chat does not exist"""
+        updated = conn.execute(f"""
+            UPDATE chats
+            SET updated_at = {NOW},
+                message_count = message_count + 1,
+                last_message_at = {NOW}
+            WHERE id = ?
+        """, (chat_id,)).rowcount
+        if not updated:
+            return None
+        return conn.execute("""
+            INSERT INTO messages (chat_id, role, content, personality, color, token_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            RETURNING id, role, content, token_count, created_at
+        """, (chat_id, role, content, personality, color, token_count)).fetchone()
+
+    def add_message(self, chat_id: int, role: str, content: str,
+                    personality: str = None, color: str = None, token_count: int = None):
+        """Add a message to a chat"""
+        with self.transaction() as conn:
+            self._insert_message(conn, chat_id, role, content, personality, color, token_count)
+
+    def add_messages_batch(self, messages: List[Dict]):
+        """Insert many messages in one transaction and bump each chat once.
+
+        Messages whose chat no longer exists are skipped.
+        """
+        if not messages:
+            return
+        counts = {}
+        for message in messages:
+            counts[message["chat_id"]] = counts.get(message["chat_id"], 0) + 1
+        with self.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO messages (chat_id, role, content, personality, color, token_count)
+                SELECT ?, ?, ?, ?, ?, ?
+                WHERE EXISTS (SELECT 1 FROM chats WHERE id = ?)
+            """, [(m["chat_id"], m["role"], m["content"], m.get("personality"), m.get("color"),
+                   m.get("token_count"), m["chat_id"]) for m in messages])
+            conn.executemany(f"""
+                UPDATE chats
+                SET updated_at = {NOW},
+                    message_count = message_count + ?,
+                    last_message_at = {NOW}
+                WHERE id = ?
+            """, [(added, chat_id) for chat_id, added in counts.items()])
+
+    def export_rows(self) -> Iterator[Dict]:
+        """Yield every chat joined with its messages, ordered by chat then message id.
+
+        Uses a dedicated connection and read transaction, so the generator
+        can be advanced from any thread and sees one consistent snapshot.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            cursor = conn.execute("""
+            SELECT c.id AS chat_id, c.title, c.created_at AS chat_created_at, c.updated_at AS chat_updated_at,
+                   m.id AS message_id, m.role, m.content, m.personality, m.color, m.token_count, m.created_at
+            FROM chats c
+            LEFT JOIN messages m ON m.chat_id = c.id
+            ORDER BY c.id, m.id
+            """)
+            for row in cursor:
+                yield dict(row)
+            conn.execute("COMMIT")
+        finally:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def import_chat(self, title: str, created_at: datetime = None, updated_at: datetime = None) -> int:
+        """Create a chat from an export, keeping its timestamps"""
+        with self.transaction() as conn:
+            return conn.execute(f"""
+                INSERT INTO chats (title, created_at, updated_at)
+                VALUES (?, COALESCE(?, {NOW}), COALESCE(?, {NOW}))
+                RETURNING id
+            """, (title, created_at, updated_at)).fetchone()[0]
+
+    def import_messages(self, messages: List[Dict]):
+        """Bulk-load exported messages and update their chats' counters"""
+        if not messages:
+            return
+        counters = {}
+        for message in messages:
+            count, last = counters.get(message["chat_id"], (0, message["created_at"]))
+            counters[message["chat_id"]] = (count + 1, max(last, message["created_at"]))
+        with self.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO messages (chat_id, role, content, personality, color, token_count, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(m["chat_id"], m["role"], m["content"], m["personality"], m["color"],
+                   m["token_count"], m["created_at"]) for m in messages])
+            conn.executemany("""
+                UPDATE chats
+                SET message_count = message_count + ?,
+                    last_message_at = MAX(COALESCE(last_message_at, ?), ?)
+                WHERE id = ?
+            """, [(count, last, last, chat_id) for chat_id, (count, last) in counters.items()])
+
+    def begin_turn(self, chat_id: int, content: str, token_count: int = None,
+                   context_limit: int = 50) -> Optional[Dict]:
+        """Store a user message and read back recent context and the chat's summary in one transaction"""
+        with self.transaction() as conn:
+            message = self._insert_message(conn, chat_id, "user", content, token_count=token_count)
+            if message is None:
+                return None
+            rows = conn.execute("""
+                SELECT id, role, content, token_count, created_at
+                FROM messages
+                WHERE chat_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            """, (chat_id, message["id"], context_limit - 1)).fetchall()
+            summary = conn.execute("""
+                SELECT content, covered_message_id, token_count
+                FROM chat_summaries
+                WHERE chat_id = ?
+            """, (chat_id,)).fetchone()
+        recent = [dict(message)] + [dict(row) for row in rows]
+        return {"message": recent[0], "recent": recent, "summary": dict(summary) if summary else None}
+
+    def finish_turn(self, chat_id: int, content: str, personality: str = None,
+                    color: str = None, token_count: int = None) -> Dict:
+        """Store an assistant reply and bump the chat's counters"""
+        with self.transaction() as conn:
+            message = self._insert_message(conn, chat_id, "assistant", content, personality, color, token_count)
+        return {"id": message["id"], "created_at": message["created_at"]} if message else None
+
+    def delete_message(self, message_id: int):
+        """Delete a single message and update its chat's counters"""
+        with self.transaction() as conn:
+            row = conn.execute("DELETE FROM messages WHERE id = ? RETURNING chat_id", (message_id,)).fetchone()
+            if row:
+                conn.execute("""
+                    UPDATE chats
+                    SET message_count = MAX(message_count - 1, 0),
+                        last_message_at = (SELECT MAX(created_at) FROM messages WHERE chat_id = ?)
+                    WHERE id = ?
+                """, (row[0], row[0]))
+
+    def delete_chat(self, chat_id: int):
+        """Delete a chat and all its messages"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+
+    def update_chat_title(self, chat_id: int, title: str):
+        """Update chat title"""
+        with self.transaction() as conn:
+            conn.execute(f"UPDATE chats SET title = ?, updated_at = {NOW} WHERE id = ?", (title, chat_id))
+
+    def get_chat_info(self, chat_id: int) -> Optional[Dict]:
+        """Get chat information"""
+        row = self.get_connection().execute("""
+            SELECT id, title, created_at, updated_at
+            FROM chats
+            WHERE id = ?
+        """, (chat_id,)).fetchone()
+        return dict(row) if row else None
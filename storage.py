@@ -0,0 +1,201 @@
+import os
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Tuple
+
+class StorageBackend(ABC):
+    """Interface shared by the chat storage backends.
+
+    ``DatabaseManager`` implements it on PostgreSQL and
+    ``SQLiteDatabaseManager`` on an embedded SQLite file.
+    ``AsyncDatabaseManager`` offers the same methods as coroutines.
+    """
+
+    @abstractmethod
+    def create_chat(self, title: str) -> int:
+        """Create a new chat session"""
+
+    @abstractmethod
+    def get_all_chats(self) -> List[Dict]:
+        """Get all chat sessions"""
+
+    @abstractmethod
+    def get_chats_page(self, limit: int, before: Tuple[datetime, int] = None,
+                       after: Tuple[datetime, int] = None) -> Tuple[List[Dict], bool]:
+        """Get one page of chats ordered by (updated_at, id) descending"""
+
+    @abstractmethod
+    def get_chat_messages(self, chat_id: int) -> List[Dict]:
+        """Get all messages for a specific chat"""
+
+    @abstractmethod
+    def get_messages_page(self, chat_id: int, limit: int, before: int = None,
+                          after: int = None) -> Tuple[List[Dict], bool]:
+        """Get one page of a chat's messages in chronological order"""
+
+    @abstractmethod
+    def get_recent_messages(self, chat_id: int, limit: int, before: int = None) -> List[Dict]:
+        """Get up to ``limit`` messages of a chat, newest first"""
+
+    @abstractmethod
+    def search_messages(self, query: str, limit: int, chat_id: int = None, role: str = None,
+                        personality: str = None, after: Tuple[float, int] = None) -> Tuple[List[Dict], bool]:
+        """Full-text search over messages, best matches first"""
+
+    @abstractmethod
+    def get_chat_summary(self, chat_id: int) -> Optional[Dict]:
+        """Get a chat's stored summary and the last message id it covers"""
+
+    @abstractmethod
+    def save_chat_summary(self, chat_id: int, content: str, covered_message_id: int, token_count: int):
+        """Store a chat's summary unless a newer one is already stored"""
+
+    @abstractmethod
+    def set_token_counts(self, counts: List[tuple]):
+        """Store token counts given as (message_id, token_count) pairs"""
+
+    @abstractmethod
+    def add_message(self, chat_id: int, role: str, content: str,
+                    personality: str = None, color: str = None, token_count: int = None):
+        """Add a message to a chat"""
+
+    @abstractmethod
+    def add_messages_batch(self, messages: List[Dict]):
+        """Insert many messages at once, skipping chats that no longer exist"""
+
+    @abstractmethod
+    def export_rows(self) -> Iterator[Dict]:
+        """Yield every chat joined with its messages, ordered by chat then message id"""
+
+    @abstractmethod
+    def import_chat(self, title: str, created_at: datetime = None, updated_at: datetime = None) -> int:
+        """Create a chat from an export, keeping its timestamps"""
+
+    @abstractmethod
+    def import_messages(self, messages: List[Dict]):
+        """Bulk-load exported messages and update their chats' counters"""
+
+    @abstractmethod
+    def begin_turn(self, chat_id: int, content: str, token_count: int = None,
+                   context_limit: int = 50) -> Optional[Dict]:
+        """Store a user message and read back recent context and the chat's summary"""
+
+    @abstractmethod
+    def finish_turn(self, chat_id: int, content: str, personality: str = None,
+                    color: str = None, token_count: int = None) -> Dict:
+        """Store an assistant reply"""
+
+    @abstractmethod
+    def delete_message(self, message_id: int):
+        """Delete a single message and update its chat's counters"""
+
+    @abstractmethod
+    def delete_chat(self, chat_id: int):
+        """Delete a chat and all its messages"""
+
+    @abstractmethod
+    def update_chat_title(self, chat_id: int, title: str):
+        """Update chat title"""
+
+    @abstractmethod
+    def get_chat_info(self, chat_id: int) -> Optional[Dict]:
+        """Get chat information"""
+
+    @abstractmethod
+    def ping(self):
+        """Run a trivial query; raises if the database is unreachable"""
+
+    @abstractmethod
+    def pool_stats(self) -> Dict:
+        """Get connection statistics"""
+
+    @abstractmethod
+    def close(self):
+        """Release all connections"""
+
+class AsyncStorageAdapter:
+    """Expose a synchronous StorageBackend with the AsyncDatabaseManager API.
+
+    Each call runs in the default thread pool, so the event loop never waits
+    on the backend.
+    """
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
+
+    def pool_stats(self) -> Dict:
+        return self.backend.pool_stats()
+
+    async def export_rows(self, batch_size: int = 1000) -> AsyncIterator[Dict]:
+        """Advance the backend's export generator in a thread, one batch at a time"""
+        rows = self.backend.export_rows()
+        try:
+            while True:
+                batch = await asyncio.to_thread(lambda: list(itertools.islice(rows, batch_size)))
+                if not batch:
+                    break
+                for row in batch:
+                    yield row
+        finally:
+            await asyncio.to_thread(rows.close)
+
+    async def close(self):
+        await asyncio.to_thread(self.backend.close)
+
+def split_summary(recent: List[Dict]) -> Optional[Dict]:
+    """Strip the summary_* columns from begin_turn's rows; returns the chat's summary or None.
+
+    The PostgreSQL backends return the summary on the new message's row so
+    it comes back in the same statement.
+    """
+    columns = ("content", "covered_message_id", "token_count")
+    summary = None
+    for row in recent:
+        values = [row.pop(f"summary_{column}", None) for column in columns]
+        if values[0] is not None:
+            summary = dict(zip(columns, values))
+    return summary
+
+def get_sqlite_path(database_url: Optional[str]) -> Optional[str]:
+    """SQLite file for a DATABASE_URL, or None if it names a PostgreSQL server.
+
+    A missing DATABASE_URL selects SQLITE_PATH (default ``skynet.db``).
+    """
+    if not database_url:
+        return os.environ.get("SQLITE_PATH", "skynet.db")
+    if database_url.startswith("sqlite://"):
+        # sqlite:///relative.db, sqlite:////absolute.db, or sqlite:// for in-memory
+        path = database_url[len("sqlite:///"):] if database_url.startswith("sqlite:///") else ""
+        return path or ":memory:"
+    return None
+
+def create_database_manager() -> StorageBackend:
+    """Build the synchronous storage backend selected by DATABASE_URL"""
+    sqlite_path = get_sqlite_path(os.environ.get("DATABASE_URL"))
+    if sqlite_path is not None:
+        from sqlite_database import SQLiteDatabaseManager
+        return SQLiteDatabaseManager(sqlite_path)
+    from database import DatabaseManager
+    return DatabaseManager()
+
+def create_async_database_manager():
+    """Build the async storage backend selected by DATABASE_URL"""
+    sqlite_path = get_sqlite_path(os.environ.get("DATABASE_URL"))
+    if sqlite_path is not None:
+        from sqlite_database import SQLiteDatabaseManager
+        return AsyncStorageAdapter(SQLiteDatabaseManager(sqlite_path))
+    from async_database import AsyncDatabaseManager
+    return AsyncDatabaseManager()
@@ -0,0 +1,143 @@
+import os
+import asyncio
+from typing import Dict, List, Optional
+
+from admission import Rejected, provider_retry_after
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Update the current summary with the new messages. Keep names, facts, decisions, open tasks "
+    "and the user's stated preferences; drop small talk. Write in the third person and reply "
+    "with the updated summary only."
+)
+
+class ConversationSummarizer:
+    """Fold older chat history into one stored summary per chat.
+
+    ``ContextBuilder`` prepends the summary to the prompt and only sends raw
+    messages newer than the last one it covers. When a chat has more than
+    ``trigger_messages`` uncovered messages, or they no longer fit the
+    budget, ``schedule`` starts a background refresh that folds everything
+    except the newest ``keep_recent`` messages into the summary, in chunks
+    of at most ``chunk_tokens`` tokens, one model call per chunk.
+
+    With an ``admission`` controller each call takes a model slot, and a
+    refresh is deferred to a later turn while the provider is rate limiting
+    or user requests are waiting for a slot.
+    """
+
+    def __init__(self, db, get_openai_client, model: str, count_tokens,
+                 trigger_messages: int = 40, keep_recent: int = 20,
+                 chunk_tokens: int = 6000, max_summary_tokens: int = 400, admission=None):
+        self.db = db
+        self.get_openai_client = get_openai_client
+        self.model = model
+        self.count_tokens = count_tokens
+        self.trigger_messages = trigger_messages
+        self.keep_recent = keep_recent
+        self.chunk_tokens = chunk_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.admission = admission
+        self._tasks = {}  # chat_id -> running refresh task
+        self._stats = {"refreshes": 0, "folded_messages": 0, "deferred": 0, "failed": 0}
+
+    @classmethod
+    def from_env(cls, db, get_openai_client, model: str, count_tokens,
+                 admission=None) -> Optional["ConversationSummarizer"]:
+        """Build the summarizer from SUMMARY_* settings; None when disabled"""
+        if os.environ.get("SUMMARY_ENABLED", "0") != "1":
+            return None
+        return cls(
+            db,
+            get_openai_client,
+            os.environ.get("SUMMARY_MODEL", model),
+            count_tokens,
+            trigger_messages=int(os.environ.get("SUMMARY_TRIGGER_MESSAGES", "40")),
+            keep_recent=int(os.environ.get("SUMMARY_KEEP_RECENT", "20")),
+            chunk_tokens=int(os.environ.get("SUMMARY_CHUNK_TOKENS", "6000")),
+            max_summary_tokens=int(os.environ.get("SUMMARY_MAX_TOKENS", "400")),
+            admission=admission,
+        )
+
+    async def get_summary(self, chat_id: int) -> Optional[Dict]:
+        return await self.db.get_chat_summary(chat_id)
+
+    def should_refresh(self, unsummarized: int, exhausted: bool) -> bool:
+        return exhausted or unsummarized >= self.trigger_messages
+
+    def schedule(self, chat_id: int):
+        """Start a background refresh for a chat unless one is already running"""
+        if chat_id in self._tasks:
+            return
+        task = asyncio.create_task(self._refresh(chat_id))
+        self._tasks[chat_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(chat_id, None))
+
+    async def _summarize(self, summary: str, messages: List[Dict]) -> str:
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        ticket = await self.admission.admit_background() if self.admission is not None else None
+        try:
+            response = await self.get_openai_client().chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+                ],
+                max_tokens=self.max_summary_tokens,
+                temperature=0.2
+            )
+        except Exception as e:
+            retry_after = provider_retry_after(e)
+            if retry_after is not None and self.admission is not None:
+                self.admission.provider_rate_limited(retry_after)
+            raise
+        finally:
+            if ticket is not None:
+                ticket.release()
+        return response.choices[0].message.content.strip()
+
+    async def _refresh(self, chat_id: int):
+        try:
+            # Messages from the oldest of the newest keep_recent on stay raw
+            recent = await self.db.get_recent_messages(chat_id, self.keep_recent)
+            if len(recent) < self.keep_recent:
+                return
+            cutoff = recent[-1]["id"]
+
+            summary = await self.db.get_chat_summary(chat_id)
+            content = summary["content"] if summary else ""
+            covered = summary["covered_message_id"] if summary else 0
+            while covered < cutoff:
+                rows, _ = await self.db.get_messages_page(chat_id, 500, after=covered)
+                chunk = []
+                tokens = 0
+                for row in rows:
+                    if row["id"] >= cutoff:
+                        break
+                    tokens += self.count_tokens(row["content"])
+                    if chunk and tokens > self.chunk_tokens:
+                        break
+                    chunk.append(row)
+                if not chunk:
+                    break
+                content = await self._summarize(content, chunk)
+                covered = chunk[-1]["id"]
+                await self.db.save_chat_summary(chat_id, content, covered, self.count_tokens(content))
+                self._stats["refreshes"] += 1
+                self._stats["folded_messages"] += len(chunk)
+        except Rejected:
+            # Picked up again by the chat's next turn
+            self._stats["deferred"] += 1
+        except Exception as e:
+            self._stats["failed"] += 1
+            print(f"Summary refresh failed for chat {chat_id}: {e}")
+
+    async def stop(self):
+        """Cancel running refreshes; the next turn of each chat schedules them again"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {**self._stats, "running": len(self._tasks)}
@@ -0,0 +1,20 @@
+import pytest
+
+class FakeClock:
+    """Stands in for the ``time`` module so tests can move time forward"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
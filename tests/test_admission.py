@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionController, Rejected, TokenBucket, provider_retry_after
+
+@pytest.fixture
+def frozen(clock, monkeypatch):
+    """Freeze the buckets' clock so no tokens refill between calls"""
+    monkeypatch.setattr(admission, "time", clock)
+    return clock
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.updated = clock.now
+    bucket.take(60)
+    assert bucket.wait_time(1, clock.now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, clock.now + 1) == 0
+    assert bucket.wait_time(0, clock.now + 3600) == 0
+    assert bucket.level == 60
+
+def test_token_bucket_wait_is_capped_at_burst(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.updated = clock.now
+    assert bucket.wait_time(1000, clock.now) == 0
+
+def test_new_client_gets_its_full_burst():
+    async def scenario():
+        controller = AdmissionController(client_requests_per_minute=1)
+        (await controller.admit("c1", 1, 10)).release()
+        with pytest.raises(Rejected):
+            await controller.admit("c1", 1, 10)
+
+    asyncio.run(scenario())
+
+def test_queue_full_is_rejected_with_429():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        ticket = await controller.admit("c1", 1, 10)
+        waiter = asyncio.create_task(controller.admit("c2", 2, 10))
+        await asyncio.sleep(0)
+        assert controller.stats()["waiting"] == 1
+
+        with pytest.raises(Rejected) as rejected:
+            await controller.admit("c3", 3, 10)
+        assert rejected.value.status_code == 429
+        assert rejected.value.reason == "queue_full"
+        assert int(rejected.value.headers["Retry-After"]) >= 1
+
+        ticket.release()
+        (await waiter).release()
+        assert controller.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        ticket = await controller.admit("c1", 1, 10)
+        with pytest.raises(Rejected) as rejected:
+            await controller.admit("c2", 2, 10)
+        assert rejected.value.status_code == 503
+        assert rejected.value.reason == "queue_timeout"
+        stats = controller.stats()
+        assert (stats["timed_out"], stats["waiting"], stats["in_flight"]) == (1, 0, 1)
+        ticket.release()
+
+    asyncio.run(scenario())
+
+def test_client_token_limit_rejects_with_retry_after(frozen):
+    async def scenario():
+        controller = AdmissionController(client_tokens_per_minute=600)
+        (await controller.admit("c1", 1, 500)).release(used_tokens=500)
+        with pytest.raises(Rejected) as rejected:
+            await controller.admit("c1", 1, 200)
+        assert rejected.value.status_code == 429
+        assert rejected.value.reason == "client_tokens"
+        # 100 tokens short at 10 tokens a second
+        assert rejected.value.retry_after == pytest.approx(10)
+        # Other clients have their own bucket
+        (await controller.admit("c2", 1, 200)).release()
+
+    asyncio.run(scenario())
+
+def test_unused_reservation_is_returned_on_release(frozen):
+    async def scenario():
+        controller = AdmissionController(chat_tokens_per_minute=1000)
+        ticket = await controller.admit("c1", 7, 800)
+        ticket.release(used_tokens=100)
+        # Releasing twice must not refund twice
+        ticket.release(used_tokens=100)
+        bucket = controller._buckets[("chat", 7)][1]
+        assert bucket.level == pytest.approx(900)
+
+    asyncio.run(scenario())
+
+def test_usage_over_the_reservation_is_charged_on_release(frozen):
+    async def scenario():
+        controller = AdmissionController(chat_tokens_per_minute=1000)
+        (await controller.admit("c1", 7, 100)).release(used_tokens=700)
+        bucket = controller._buckets[("chat", 7)][1]
+        assert bucket.level == pytest.approx(300)
+
+    asyncio.run(scenario())
+
+def test_rejected_slot_wait_refunds_tokens(frozen):
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=0, client_tokens_per_minute=1000)
+        ticket = await controller.admit("c1", 1, 100)
+        with pytest.raises(Rejected):
+            await controller.admit("c2", 2, 300)
+        assert controller._buckets[("client", "c2")][1].level == pytest.approx(1000)
+        ticket.release()
+
+    asyncio.run(scenario())
+
+def test_provider_cooldown_rejects_until_it_passes(frozen):
+    async def scenario():
+        controller = AdmissionController()
+        controller.provider_rate_limited(5)
+        with pytest.raises(Rejected) as rejected:
+            await controller.admit("c1", 1, 10)
+        assert rejected.value.reason == "provider_cooldown"
+        assert rejected.value.retry_after == pytest.approx(5)
+        frozen.advance(5.1)
+        (await controller.admit("c1", 1, 10)).release()
+
+    asyncio.run(scenario())
+
+def test_background_calls_yield_to_user_requests():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1)
+        ticket = await controller.admit_background()
+        ticket.release()
+
+        ticket = await controller.admit("c1", 1, 10)
+        with pytest.raises(Rejected) as rejected:
+            await controller.admit_background()
+        assert rejected.value.reason == "background_deferred"
+        ticket.release()
+
+        controller.provider_rate_limited(5)
+        with pytest.raises(Rejected) as rejected:
+            await controller.admit_background()
+        assert rejected.value.reason == "provider_cooldown"
+
+    asyncio.run(scenario())
+
+class ProviderError(Exception):
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers})()
+
+def test_provider_retry_after():
+    assert provider_retry_after(ProviderError(500, {})) is None
+    assert provider_retry_after(ProviderError(429, {"retry-after": "3"})) == 3
+    assert provider_retry_after(ProviderError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert provider_retry_after(ProviderError(429, {"retry-after": "soon"}), default=2) == 2
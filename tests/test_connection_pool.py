@@ -0,0 +1,145 @@
+import time
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+import database
+from database import ConnectionPool, PoolTimeout
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.queries.append(query)
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.queries = []
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Every connection the pool opens, in order"""
+    opened = []
+
+    def connect(dsn):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(psycopg2, "connect", connect)
+    return opened
+
+def test_checkout_times_out_when_pool_is_exhausted(connections):
+    pool = ConnectionPool("postgresql://test", min_size=0, max_size=1, timeout=0.05)
+    held = pool.getconn()
+
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()["checkout_timeouts"] == 1
+
+    # The slot frees up once the connection is returned
+    pool.putconn(held)
+    assert pool.getconn() is held
+    assert len(connections) == 1
+
+def test_connections_are_reused_lifo(connections):
+    pool = ConnectionPool("postgresql://test", min_size=2, max_size=2)
+    pool.open()
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    assert pool.getconn() is second
+    assert len(connections) == 2
+
+def test_expired_connection_is_replaced_at_checkout(connections, clock, monkeypatch):
+    monkeypatch.setattr(database, "time", clock)
+    pool = ConnectionPool("postgresql://test", min_size=0, max_size=1, max_lifetime=60, check_idle=3600)
+    old = pool.getconn()
+    pool.putconn(old)
+
+    clock.advance(61)
+    new = pool.getconn()
+    assert new is not old
+    assert old.closed
+    assert pool.stats()["expired"] == 1
+    assert pool.stats()["size"] == 1
+
+def test_expired_connection_is_closed_on_return(connections, clock, monkeypatch):
+    monkeypatch.setattr(database, "time", clock)
+    pool = ConnectionPool("postgresql://test", min_size=0, max_size=1, max_lifetime=60)
+    conn = pool.getconn()
+
+    clock.advance(61)
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()["idle"] == 0
+    assert pool.stats()["expired"] == 1
+
+def test_idle_connection_failing_health_check_is_discarded(connections, clock, monkeypatch):
+    monkeypatch.setattr(database, "time", clock)
+    pool = ConnectionPool("postgresql://test", min_size=0, max_size=1, check_idle=5)
+    dead = pool.getconn()
+    pool.putconn(dead)
+
+    dead.broken = True
+    clock.advance(6)
+    conn = pool.getconn()
+    assert conn is not dead
+    assert dead.closed
+    assert pool.stats()["health_check_failures"] == 1
+
+def test_recently_returned_connection_skips_health_check(connections, clock, monkeypatch):
+    monkeypatch.setattr(database, "time", clock)
+    pool = ConnectionPool("postgresql://test", min_size=0, max_size=1, check_idle=5)
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    clock.advance(1)
+    assert pool.getconn() is conn
+    assert conn.queries == []
+
+    pool.putconn(conn)
+    clock.advance(6)
+    assert pool.getconn() is conn
+    assert conn.queries == ["SELECT 1"]
+
+def test_connection_context_discards_connection_that_cannot_roll_back(connections):
+    pool = ConnectionPool("postgresql://test", min_size=0, max_size=1)
+
+    def rollback():
+        raise psycopg2.InterfaceError("connection already closed")
+
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.rollback = rollback
+            raise RuntimeError("query failed")
+    assert conn.closed
+    assert pool.stats()["size"] == 0
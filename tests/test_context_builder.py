@@ -0,0 +1,19 @@
+from context_builder import get_context_budget
+
+def test_budget_defaults_per_model(monkeypatch):
+    monkeypatch.delenv("CONTEXT_TOKEN_BUDGET", raising=False)
+    monkeypatch.delenv("CONTEXT_TOKEN_BUDGETS", raising=False)
+    assert get_context_budget("gpt-4o") == 8000
+    assert get_context_budget("gpt-4") == 4000
+    assert get_context_budget("unknown-model") == 4000
+
+def test_per_model_override_wins_over_global(monkeypatch):
+    monkeypatch.setenv("CONTEXT_TOKEN_BUDGETS", "gpt-4o=12000, gpt-4=3000")
+    monkeypatch.setenv("CONTEXT_TOKEN_BUDGET", "5000")
+    assert get_context_budget("gpt-4o") == 12000
+    assert get_context_budget("gpt-4") == 3000
+    assert get_context_budget("gpt-3.5-turbo") == 5000
+
+def test_budget_is_capped_by_context_window(monkeypatch):
+    monkeypatch.setenv("CONTEXT_TOKEN_BUDGETS", "gpt-4=100000")
+    assert get_context_budget("gpt-4", max_completion_tokens=1000) == 8192 - 1000
@@ -0,0 +1,62 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache
+
+@pytest.fixture
+def cache(clock, monkeypatch):
+    monkeypatch.setattr(response_cache, "time", clock)
+    # Each entry below is a 1-char key plus a 10-byte response
+    return ResponseCache(max_bytes=33, ttl=60)
+
+def test_hit_and_miss(cache):
+    cache.set("a", "x" * 10)
+    assert cache.get("a") == "x" * 10
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+def test_least_recently_used_entry_is_evicted(cache):
+    for key in "abc":
+        cache.set(key, "x" * 10)
+    cache.get("a")
+    cache.set("d", "x" * 10)
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 33
+
+def test_replacing_an_entry_does_not_double_count(cache):
+    cache.set("a", "x" * 10)
+    cache.set("a", "y" * 10)
+    assert cache.stats()["bytes"] == 11
+    assert cache.get("a") == "y" * 10
+
+def test_entry_expires_after_ttl(cache, clock):
+    cache.set("a", "x" * 10)
+    clock.advance(59)
+    assert cache.get("a") is not None
+    clock.advance(2)
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["expirations"], stats["entries"], stats["bytes"]) == (1, 0, 0)
+
+def test_response_larger_than_cache_is_not_stored(cache):
+    cache.set("a", "x" * 100)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+def test_bypass_for_fresh_requests_and_high_temperature():
+    cache = ResponseCache(max_temperature=0.5)
+    assert not cache.should_bypass(0.5)
+    assert cache.should_bypass(0.7)
+    assert cache.should_bypass(0.0, fresh=True)
+    assert cache.stats()["bypasses"] == 2
+
+def test_key_depends_on_prompt_and_parameters():
+    messages = [{"role": "user", "content": "hi"}]
+    key = ResponseCache.make_key("gpt-4o", messages, temperature=0.2)
+    assert key == ResponseCache.make_key("gpt-4o", [dict(messages[0])], temperature=0.2)
+    assert key != ResponseCache.make_key("gpt-4o", messages, temperature=0.3)
+    assert key != ResponseCache.make_key("gpt-4o-mini", messages, temperature=0.2)
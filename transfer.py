@@ -0,0 +1,143 @@
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict
+
+# Export format: one JSON object per line. Each chat line is followed by the
+# lines of its messages, so an import only has to remember the chat it is in.
+#   {"type": "chat", "id": 1, "title": "...", "created_at": "...", "updated_at": "..."}
+#   {"type": "message", "chat_id": 1, "role": "user", "content": "...", ...}
+
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH_SIZE = 1000
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+async def export_ndjson(db, compress: bool = False) -> AsyncIterator[bytes]:
+    """Stream every chat and message as NDJSON, optionally gzip-compressed.
+
+    Rows come from a server-side cursor and are written out in chunks of
+    about EXPORT_CHUNK_BYTES, so memory use does not grow with the dataset.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    size = 0
+    current_chat = None
+    async for row in db.export_rows():
+        lines = []
+        if row["chat_id"] != current_chat:
+            current_chat = row["chat_id"]
+            lines.append({
+                "type": "chat",
+                "id": row["chat_id"],
+                "title": row["title"],
+                "created_at": row["chat_created_at"],
+                "updated_at": row["chat_updated_at"],
+            })
+        if row["message_id"] is not None:
+            lines.append({
+                "type": "message",
+                "chat_id": row["chat_id"],
+                "role": row["role"],
+                "content": row["content"],
+                "personality": row["personality"],
+                "color": row["color"],
+                "token_count": row["token_count"],
+                "created_at": row["created_at"],
+            })
+        for line in lines:
+            data = json.dumps(line, default=_json_default).encode() + b"\n"
+            buffer.append(data)
+            size += len(data)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+async def _iter_lines(chunks: AsyncIterator[bytes], compressed: bool) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj(wbits=47) if compressed else None
+    pending = b""
+    async for chunk in chunks:
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if decompressor:
+        pending += decompressor.flush()
+    for line in pending.split(b"\n"):
+        yield line
+
+async def import_ndjson(db, chunks: AsyncIterator[bytes], compressed: bool = False) -> Dict:
+    """Load an NDJSON export, streaming it in batches of IMPORT_BATCH_SIZE messages.
+
+    Chats get new ids; messages are bulk-loaded into the chat they follow.
+    Each batch is stored in one transaction. If one fails, the chat being
+    imported is deleted again, so it is not left holding only part of its
+    messages, and the error is raised; chats already imported are kept.
+    """
+    stats = {"chats": 0, "messages": 0, "skipped": 0}
+    batch = []
+    exported_chat_id = None
+    chat_id = None
+
+    async def flush():
+        if batch:
+            try:
+                await db.import_messages(batch)
+            except Exception:
+                await db.delete_chat(chat_id)
+                raise
+            stats["messages"] += len(batch)
+            batch.clear()
+
+    async for line in _iter_lines(chunks, compressed):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            stats["skipped"] += 1
+            continue
+        if record.get("type") == "chat":
+            await flush()
+            exported_chat_id = record.get("id")
+            chat_id = await db.import_chat(
+                record.get("title") or "Imported chat",
+                _parse_timestamp(record.get("created_at")),
+                _parse_timestamp(record.get("updated_at")),
+            )
+            stats["chats"] += 1
+        elif (record.get("type") == "message" and chat_id is not None
+              and record.get("chat_id") == exported_chat_id
+              and record.get("role") and record.get("content") is not None):
+            batch.append({
+                "chat_id": chat_id,
+                "role": record["role"],
+                "content": record["content"],
+                "personality": record.get("personality"),
+                "color": record.get("color"),
+                "token_count": record.get("token_count"),
+                "created_at": _parse_timestamp(record.get("created_at")) or datetime.now(),
+            })
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await flush()
+        else:
+            stats["skipped"] += 1
+    await flush()
+    return stats
@@ -0,0 +1,125 @@
+import os
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+class WriteBehindQueue:
+    """Persist messages off the request path in batches.
+
+    ``enqueue`` returns as soon as the message is queued; a background task
+    drains the queue and stores up to ``batch_size`` messages per
+    ``add_messages_batch`` call, which inserts them with one multi-row
+    statement and bumps each chat's timestamp and counters once per batch.
+    When ``max_queue`` messages are waiting, ``enqueue`` blocks until the
+    writer catches up.
+
+    Ordering is only kept within one process, so it needs a single worker;
+    run_backend.py refuses to start several with write-behind enabled.
+    """
+
+    def __init__(self, db, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.05, max_retries: int = 3):
+        self.db = db
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = None
+        self._task = None
+        self._pending = defaultdict(int)  # chat_id -> queued or in-flight messages
+        self._flushed = None
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "failed": 0, "dropped": 0}
+
+    @classmethod
+    def from_env(cls, db) -> Optional["WriteBehindQueue"]:
+        """Build the queue from WRITE_BEHIND_* settings; None when disabled"""
+        if os.environ.get("WRITE_BEHIND_ENABLED", "0") != "1":
+            return None
+        return cls(
+            db,
+            max_queue=int(os.environ.get("WRITE_BEHIND_MAX_QUEUE", "10000")),
+            batch_size=int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "500")),
+            flush_interval=float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL", "0.05")),
+        )
+
+    def start(self):
+        """Start the background writer in the running event loop"""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._flushed = asyncio.Condition()
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, chat_id: int, role: str, content: str, personality: str = None,
+                      color: str = None, token_count: int = None):
+        """Queue a message for storage, waiting for room if the queue is full"""
+        self.start()
+        self._pending[chat_id] += 1
+        await self._queue.put({
+            "chat_id": chat_id,
+            "role": role,
+            "content": content,
+            "personality": personality,
+            "color": color,
+            "token_count": token_count,
+        })
+        self._stats["enqueued"] += 1
+
+    async def wait_for_chat(self, chat_id: int):
+        """Wait until every queued message of a chat has been written"""
+        if not self._pending.get(chat_id):
+            return
+        async with self._flushed:
+            await self._flushed.wait_for(lambda: not self._pending.get(chat_id))
+
+    async def _write(self, batch: List[Dict]):
+        for attempt in range(self.max_retries):
+            try:
+                await self.db.add_messages_batch(batch)
+                self._stats["written"] += len(batch)
+                self._stats["batches"] += 1
+                return
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"Write-behind flush failed (attempt {attempt + 1}/{self.max_retries}): {e}")
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        self._stats["dropped"] += len(batch)
+        print(f"Write-behind dropped {len(batch)} messages after {self.max_retries} attempts")
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Give concurrent requests a moment to join this batch
+            if self.flush_interval:
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._write(batch)
+            finally:
+                for message in batch:
+                    self._pending[message["chat_id"]] -= 1
+                    if not self._pending[message["chat_id"]]:
+                        del self._pending[message["chat_id"]]
+                    self._queue.task_done()
+                async with self._flushed:
+                    self._flushed.notify_all()
+
+    async def flush(self):
+        """Wait until everything queued so far has been written"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        """Flush outstanding messages and stop the background writer"""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict:
+        return {**self._stats, "queued": self._queue.qsize() if self._queue else 0}